@@ -3,15 +3,17 @@
 # ===================================================================
 import streamlit as st
 import pandas as pd
-import numpy as np
 import os
 from datetime import datetime
-import requests
-import io
-import zipfile
 import google.oauth2.credentials
 from google_auth_oauthlib.flow import Flow
 from googleapiclient.discovery import build
+from itbp.catalogos import CatalogStore
+from itbp.escritura import ArchiveCache
+from itbp.incremental import PartialAggregateCache
+from itbp.instrumentacion import StageRecorder, enable_json_log, profiled
+from itbp.paralelo import default_workers
+from itbp.trabajos import EN_COLA, ERROR, SIN_ARCHIVOS, JobQueue
 
 # ===================================================================
 # --- 2. CONFIGURACIÓN DE CONSTANTES GLOBALES ---
@@ -30,6 +32,22 @@ REDIRECT_URI = "https://generador-plantillas-itbp.streamlit.app/"
 # ¡IMPORTANTE! Reemplaza 'tuempresa.com' con el dominio de tu organización
 AUTHORIZED_DOMAIN = "kushkipagos.com"
 
+# --- Configuración de caché local ---
+# Directorio compartido por todas las sesiones (snapshots de catálogos, etc.); debe ser privado
+# del usuario del servidor, porque los snapshots son pickles
+DIRECTORIO_CACHE = os.environ.get("ITBP_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "itbp"))
+# Tiempo durante el cual los catálogos se usan sin volver a consultar Google Sheets
+TTL_CATALOGOS_SEGUNDOS = 15 * 60
+# Espacio máximo en disco para los totales parciales por archivo (reprocesamiento incremental)
+MAX_BYTES_CACHE_PARCIALES = 2 * 1024 ** 3
+
+# --- Configuración de procesamiento en paralelo ---
+MAX_WORKERS = default_workers()
+# Trabajos de generación que se ejecutan a la vez; los demás esperan en cola
+MAX_TRABAJOS_SIMULTANEOS = int(os.environ.get("ITBP_MAX_JOBS", 2))
+# Los procesos disponibles se reparten entre los trabajos simultáneos
+MAX_WORKERS_POR_TRABAJO = max(1, MAX_WORKERS // MAX_TRABAJOS_SIMULTANEOS)
+
 # ===================================================================
 # --- 3. DEFINICIÓN DE FUNCIONES ---
 # ===================================================================
@@ -53,119 +71,61 @@ def create_oauth_flow():
         redirect_uri=REDIRECT_URI
     )
 
-def to_excel_buffer(df):
-    """Convierte un DataFrame a un buffer de Excel en memoria."""
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Sheet1')
-    return output.getvalue()
-
-def create_zip_buffer(archivos_generados):
-    """Toma una lista de (nombre_archivo, dataframe) y crea un archivo ZIP en memoria."""
-    zip_buffer = io.BytesIO()
-    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-        for nombre_archivo, df in archivos_generados:
-            excel_buffer = to_excel_buffer(df)
-            zip_file.writestr(nombre_archivo, excel_buffer)
-    return zip_buffer.getvalue()
-
-# --- Funciones de Lógica de Negocio Original ---
-def get_output_group_date(date):
-    if date.weekday() >= 4:
-        return (date + pd.Timedelta(days=6 - date.weekday())).date()
+@st.cache_resource
+def get_catalog_store():
+    """Almacén de catálogos compartido por todas las sesiones del servidor."""
+    return CatalogStore(os.path.join(DIRECTORIO_CACHE, "catalogos"), ttl_segundos=TTL_CATALOGOS_SEGUNDOS)
+
+@st.cache_resource
+def get_archive_cache():
+    """ZIPs ya generados, compartidos entre sesiones y reruns."""
+    return ArchiveCache()
+
+@st.cache_resource
+def get_partial_cache():
+    """Totales parciales por archivo, para no volver a procesar archivos ya vistos."""
+    return PartialAggregateCache(os.path.join(DIRECTORIO_CACHE, "parciales"), max_bytes=MAX_BYTES_CACHE_PARCIALES)
+
+@st.cache_resource
+def get_job_queue():
+    """Cola de trabajos de generación compartida por todas las sesiones."""
+    return JobQueue(get_archive_cache(), get_partial_cache(), max_concurrentes=MAX_TRABAJOS_SIMULTANEOS, max_workers=MAX_WORKERS_POR_TRABAJO)
+
+@st.fragment(run_every=1)
+def show_job_progress(trabajo_id):
+    """Avance de un trabajo en curso; se redibuja cada segundo sin volver a ejecutar toda la página."""
+    trabajo = get_job_queue().get(trabajo_id)
+    if trabajo is None or not trabajo.activo:
+        # Al terminar se redibuja la página completa para mostrar el resultado
+        st.rerun()
+    if trabajo.particiones_total:
+        texto = f"Grupos procesados: {trabajo.particiones_hechas}/{trabajo.particiones_total}"
     else:
-        return date.date()
+        texto = "En cola..." if trabajo.estado == EN_COLA else "Leyendo archivos de detalle..."
+    st.progress(trabajo.progreso, text=texto)
+    st.info(trabajo.mensaje)
+    for advertencia in trabajo.advertencias:
+        st.warning(advertencia)
 
-def load_catalogs_from_url(url):
+def load_catalogs_from_url(url, registro):
     try:
-        response = requests.get(url, timeout=15)
-        response.raise_for_status()
-        file_content = io.BytesIO(response.content)
-        catalogs = {
-            'itbp': pd.read_excel(file_content, sheet_name='ITBP', engine='openpyxl'),
-            'txn': pd.read_excel(file_content, sheet_name='Transaction Type', engine='openpyxl'),
-            'procesadora': pd.read_excel(file_content, sheet_name='Procesadora', engine='openpyxl')
-        }
-        if 'Pais' in catalogs['procesadora'].columns:
-            catalogs['procesadora'].rename(columns={'Pais': 'País'}, inplace=True)
+        with registro.stage('catalogos') as medicion:
+            catalogs, origen = get_catalog_store().get(url)
+            medicion['detalle'], medicion['filas_salida'] = origen, len(catalogs['itbp'])
+        if origen == 'sin_conexion':
+            st.warning("No se pudo consultar el catálogo en línea; se usa la última copia local válida.")
         return catalogs
     except Exception as e:
         st.error(f"Error al cargar catálogos: {e}")
         return None
 
-def process_and_generate_files(df_chunk, pais_actual, grupo_fecha, catalogs):
-    st.info(f"Procesando País: {pais_actual} | Fecha Grupo: {grupo_fecha.strftime('%Y-%m-%d')}...")
-    # (El resto de esta función de procesamiento masivo se mantiene igual que en versiones anteriores)
-    COLUMNAS_PROCESADO = ['Tipo mov.','Nº cuenta','Fecha registro','Tipo documento','Nº documento','Descripción','Importe','Importe debe','Importe haber','Cód. términos pago','Tipo de registro gen.','Nº documento externo','PostingGroup2','Prepayment','Tipo contrapartida','Cta. Contrapartida','DIM 1','DIM 2','DIM 3','DIM 4','DIM 5','DIM 6','DIM 7','DIM 8','VAT\xa0Registration\xa0Type\xa0KCP','VAT\xa0Registration\xa0No."','Cód. divisa']
-    COLUMNAS_REVENUE = ['Tipo mov.','Nº cuenta','Fecha registro','Tipo documento','Nº documento','Descripción','Importe','Importe debe','Importe haber','Cód. términos pago','Tipo de registro gen.','Nº documento externo','PostingGroup2','Prepayment','Tipo contrapartida','Cta. Contrapartida','DIM 1','DIM 2','DIM 3','DIM 4','DIM 5','DIM 6','DIM 7','DIM 8','VAT\xa0Registration\xa0Type\xa0KCP','VAT\xa0Registration\xa0No."','Cód. divisa']
-    df_catalogo_itbp = catalogs['itbp']
-    df_catalogo_txn = catalogs['txn']
-    df_catalogo_procesadora = catalogs['procesadora']
-    df_cuentas_pais = df_catalogo_procesadora[df_catalogo_procesadora['País'].str.upper() == pais_actual.upper()]
-    if df_cuentas_pais.empty:
-        st.warning(f"ADVERTENCIA: No se encontraron cuentas para '{pais_actual}'. Omitiendo este grupo.")
-        return None, None
-    cuenta_procesadora = df_cuentas_pais.iloc[0]['Cuenta Contrapartida']
-    Tipo_mtvo_procesadora = df_cuentas_pais.iloc[0]['Tipo mov. Contrapartida']
-    VAT_Registration_Type_KCP = df_cuentas_pais.iloc[0]['VAT\xa0Registration\xa0Type\xa0KCP']
-    VAT_Registration_No = df_cuentas_pais.iloc[0]['VAT\xa0Registration\xa0No."']
-    df_filtrado = pd.merge(df_chunk, df_catalogo_itbp, on='merchant_id', how='inner')
-    for col in ['approved_transaction_amount','kushki_commission','iva_kushki_commission']:
-        if col in df_filtrado.columns:
-            df_filtrado[col] = pd.to_numeric(df_filtrado[col], errors='coerce').fillna(0)
-    df_totalizado = df_filtrado.groupby(['fecha_pago','createddate','merchant_id','merchant_name','currency_code','RUC_Contable_ITBP','PostingGroup2_proveedor','VAT Registration Type KCP Revenue','VAT Registration No.Revenue','TipoMovimientoCXP','DIM2','DIM3','DIM4','payment_method','transaction_type','TipoMovimientoIng','CuentaIng','CuentaIva','processor_name'], dropna=False).agg(total_approved_amount=pd.NamedAgg(column='approved_transaction_amount', aggfunc='sum'),total_kushki_commission=pd.NamedAgg(column='kushki_commission', aggfunc='sum'),total_iva_kushki_commission=pd.NamedAgg(column='iva_kushki_commission', aggfunc='sum')).reset_index()
-    df_totalizado['payment_method'] = df_totalizado['payment_method'].str.upper()
-    df_final = pd.merge(df_totalizado, df_catalogo_txn, on='transaction_type', how='left')
-    df_final['createddate'] = pd.to_datetime(df_final['createddate'])
-    df_final['Nº documento'] = 'W' + df_final['createddate'].dt.isocalendar().week.astype(str).str.zfill(2) + '-' + df_final['createddate'].dt.strftime('%y')
-    if pais_actual.upper() in ['CHILE','CHILE OPERADORA']:
-        dim3_valor, dim7_valor = '', df_final['DIM3']
-    else:
-        dim3_valor, dim7_valor = df_final['DIM3'], ''
-    df_procesado = pd.DataFrame()
-    df_procesado['Tipo mov.'] = df_final['TipoMovimientoCXP']
-    df_procesado['Nº cuenta'] = df_final['RUC_Contable_ITBP']
-    df_procesado['Fecha registro'] = df_final['createddate'].dt.strftime('%d/%m/%Y')
-    df_procesado['Nº documento'] = df_final['Nº documento']
-    df_procesado['Descripción'] = df_final['descripcion_txn'].fillna('') + ' ' + df_final['merchant_name'].fillna('')
-    df_procesado['Importe debe'] = np.where(df_final['transaction_type'].isin(['REVERSE','CHARGEBACK','VOID','REFUND']), df_final['total_approved_amount'], 0)
-    df_procesado['Importe haber'] = np.where(~df_final['transaction_type'].isin(['REVERSE','CHARGEBACK','VOID','REFUND']), df_final['total_approved_amount'], 0)
-    df_procesado['Nº documento externo'] = df_final['fecha_pago'].dt.strftime('%d/%m/%Y')
-    df_procesado['PostingGroup2'] = df_final['PostingGroup2_proveedor']
-    df_procesado['DIM 2'] = df_final['DIM2']
-    df_procesado['DIM 3'] = dim3_valor
-    df_procesado['DIM 4'] = df_final['DIM4']
-    df_procesado['DIM 7'] = dim7_valor
-    df_procesado['Cód. divisa'] = np.where((df_final['currency_code'] == 'USD') & (pais_actual.upper() == 'PERU'), df_final['currency_code'], '')
-    df_procesado['descripcion_txn'] = df_final['descripcion_txn']
-    df_procesado = df_procesado[(df_procesado['Importe debe'] != 0) | (df_procesado['Importe haber'] != 0)].copy()
-    resumen_por_fecha = df_procesado.groupby(['Fecha registro','Nº documento','descripcion_txn','Cód. divisa']).agg(total_debe=('Importe debe', 'sum'), total_haber=('Importe haber', 'sum')).reset_index()
-    nuevas_filas_resumen = []
-    doc_externo_contrapartida = '169922' if pais_actual.upper() == 'PERU' else ''
-    for _, fila in resumen_por_fecha.iterrows():
-        if fila['total_debe'] != 0 or fila['total_haber'] != 0:
-            nuevas_filas_resumen.append({'Tipo mov.': Tipo_mtvo_procesadora,'Nº cuenta': cuenta_procesadora,'Fecha registro': fila['Fecha registro'],'Nº documento': fila['Nº documento'],'Descripción': f"{fila['descripcion_txn']} KUSHKI ACQUIRER PROCESSOR",'Importe debe': fila['total_haber'],'Importe haber': fila['total_debe'],'Nº documento externo': doc_externo_contrapartida,'VAT\xa0Registration\xa0Type\xa0KCP': VAT_Registration_Type_KCP,'VAT\xa0Registration\xa0No."': VAT_Registration_No,'Cód. divisa': fila['Cód. divisa']})
-    df_procesado.drop(columns=['descripcion_txn'], inplace=True)
-    df_contrapartidas_proc = pd.DataFrame(nuevas_filas_resumen)
-    df_revenue = pd.DataFrame({'Tipo mov.': df_final['TipoMovimientoIng'],'Nº cuenta': df_final['CuentaIng'],'Fecha registro': df_final['createddate'].dt.strftime('%d/%m/%Y'),'Nº documento': df_final['Nº documento'],'Descripción': 'REVENUE ' + df_final['merchant_name'].fillna(''),'Importe debe': np.where(df_final['transaction_type'].isin(['REVERSE','CHARGEBACK','VOID','REFUND']), df_final['total_kushki_commission'], 0),'Importe haber': np.where(~df_final['transaction_type'].isin(['REVERSE','CHARGEBACK','VOID','REFUND']), df_final['total_kushki_commission'], 0),'Tipo de registro gen.': 'Compra' if pais_actual.upper() == 'PERU' else '','Nº documento externo' : df_final['fecha_pago'].dt.strftime('%d/%m/%Y'),'PostingGroup2': df_final['PostingGroup2_proveedor'],'Tipo contrapartida': df_final['TipoMovimientoCXP'],'Cta. Contrapartida': df_final['RUC_Contable_ITBP'],'DIM 2': df_final['DIM2'],'DIM 3': dim3_valor,'DIM 4': df_final['DIM4'],'DIM 7': dim7_valor,'VAT\xa0Registration\xa0Type\xa0KCP': df_final['VAT Registration Type KCP Revenue'],'VAT\xa0Registration\xa0No."': df_final['VAT Registration No.Revenue'],'Cód. divisa': np.where((df_final['currency_code'] == 'USD') & (pais_actual.upper() == 'PERU'), df_final['currency_code'], '')})
-    df_iva = pd.DataFrame({'Tipo mov.': df_final['TipoMovimientoIng'],'Nº cuenta': df_final['CuentaIva'],'Fecha registro': df_final['createddate'].dt.strftime('%d/%m/%Y'),'Nº documento': df_final['Nº documento'],'Descripción': 'IVA REVENUE ' + df_final['merchant_name'].fillna(''),'Importe debe': np.where(df_final['transaction_type'].isin(['REVERSE','CHARGEBACK','VOID','REFUND']), df_final['total_iva_kushki_commission'], 0),'Importe haber': np.where(~df_final['transaction_type'].isin(['REVERSE','CHARGEBACK','VOID','REFUND']), df_final['total_iva_kushki_commission'], 0),'Tipo de registro gen.': 'Compra' if pais_actual.upper() == 'PERU' else '','Nº documento externo' : df_final['fecha_pago'].dt.strftime('%d/%m/%Y'),'PostingGroup2': df_final['PostingGroup2_proveedor'],'Tipo contrapartida': df_final['TipoMovimientoCXP'],'Cta. Contrapartida': df_final['RUC_Contable_ITBP'],'DIM 2': df_final['DIM2'],'DIM 3': dim3_valor,'DIM 4': df_final['DIM4'],'DIM 7': dim7_valor,'VAT\xa0Registration\xa0Type\xa0KCP': df_final['VAT Registration Type KCP Revenue'],'VAT\xa0Registration\xa0No."': df_final['VAT Registration No.Revenue'],'Cód. divisa': np.where((df_final['currency_code'] == 'USD') & (pais_actual.upper() == 'PERU'), df_final['currency_code'], '')})
-    df_reporte_procesado = pd.concat([df_procesado, df_contrapartidas_proc], ignore_index=True).reindex(columns=COLUMNAS_PROCESADO).fillna('')
-    df_reporte_revenue = pd.concat([df_revenue, df_iva], ignore_index=True)
-    df_reporte_revenue = df_reporte_revenue[(df_reporte_revenue['Importe debe'] != 0) | (df_reporte_revenue['Importe haber'] != 0)].copy()
-    df_reporte_revenue = df_reporte_revenue.reindex(columns=COLUMNAS_REVENUE).fillna('')
-    for df in [df_reporte_procesado, df_reporte_revenue]:
-        df['Importe debe'] = df['Importe debe'].replace(0, '')
-        df['Importe haber'] = df['Importe haber'].replace(0, '')
-    fecha_contable_str = grupo_fecha.strftime("%Y%m%d")
-    nombre_archivo_procesado = f"Procesado_{pais_actual}_{fecha_contable_str}.xlsx"
-    nombre_archivo_revenue = f"Revenue_{pais_actual}_{fecha_contable_str}.xlsx"
-    return (nombre_archivo_procesado, df_reporte_procesado), (nombre_archivo_revenue, df_reporte_revenue)
-
 # ===================================================================
 # --- 4. LÓGICA PRINCIPAL DE LA APLICACIÓN (EL "PORTERO") ---
 # ===================================================================
 
 st.set_page_config(page_title="Generador ITBP", layout="wide")
+# Las mediciones por etapa se emiten como líneas JSON en el log del servidor
+enable_json_log()
 
 # Revisa si la información del usuario ya está en la sesión
 if 'user_info' not in st.session_state:
@@ -223,8 +183,8 @@ else:
         st.title("📄 Generador de Plantillas ITBP")
         st.write("Esta herramienta procesa los archivos 'Detalle_liquidación' para generar las Plantillas contables de 'Procesado' y 'Revenue'.")
 
-        if 'archivos_generados_zip' not in st.session_state:
-            st.session_state.archivos_generados_zip = None
+        if 'trabajo_id' not in st.session_state:
+            st.session_state.trabajo_id = None
 
         uploaded_files = st.file_uploader(
             "Selecciona uno o más archivos 'Detalle_liquidación'",
@@ -235,57 +195,88 @@ else:
         if uploaded_files:
             st.success(f"Cargaste {len(uploaded_files)} archivo(s). ¡Listo para procesar!")
 
+        perfilar = st.checkbox("Perfilar esta ejecución con cProfile (más lenta: todo se procesa en un solo proceso)")
+
         if st.button("🚀 Generar Reportes", disabled=not uploaded_files):
-            with st.spinner("Procesando y empaquetando... Esto puede tardar unos momentos."):
+            # La carga de catálogos se mide (y se perfila) aquí y pasa a formar parte del trabajo
+            registro_catalogos = StageRecorder(emitir=False)
+            with st.spinner("Cargando catálogos..."), profiled(perfilar) as perfil_catalogos:
                 google_sheet_url = "https://docs.google.com/spreadsheets/d/1WqXYeykuKGfi1Ho5MAFGB52tRIMndIJ_/export?format=xlsx"
-                st.info("Descargando catálogos...")
-                catalogs = load_catalogs_from_url(google_sheet_url)
-
-                if catalogs:
-                    st.success("Catálogos cargados correctamente.")
-                    lista_df_detalle = [pd.read_excel(file) for file in uploaded_files]
-                    df_detalle_consolidado = pd.concat(lista_df_detalle, ignore_index=True)
-                    st.info("Archivos de detalle consolidados.")
-                    
-                    # Lógica de negocio (ajuste para Chile)
-                    condicion_descarte_mid = (df_detalle_consolidado['merchant_id'] == '20000000107065050000') & (df_detalle_consolidado['processor_name'].str.strip().str.upper() != 'KUSHKI ACQUIRER PROCESSOR')
-                    df_detalle_consolidado = df_detalle_consolidado[~condicion_descarte_mid].copy()
-                    condicion_kushki = (df_detalle_consolidado['country'].str.strip().str.upper() == 'CHILE') & (df_detalle_consolidado['processor_name'].str.strip().str.upper() == 'KUSHKI ACQUIRER PROCESSOR')
-                    df_detalle_consolidado.loc[condicion_kushki, 'country'] = 'Chile Operadora'
-                    
-                    # Procesamiento principal
-                    df_detalle_consolidado['createddate'] = pd.to_datetime(df_detalle_consolidado['createddate'])
-                    df_detalle_consolidado['fecha_pago'] = pd.to_datetime(df_detalle_consolidado['fecha_pago'], errors='coerce')
-                    df_detalle_consolidado['output_group'] = df_detalle_consolidado['createddate'].apply(get_output_group_date)
-                    
-                    archivos_generados = []
-                    for pais in df_detalle_consolidado['country'].unique():
-                        df_pais = df_detalle_consolidado[df_detalle_consolidado['country'] == pais].copy()
-                        for grupo in df_pais['output_group'].unique():
-                            df_chunk = df_pais[df_pais['output_group'] == grupo]
-                            resultado_procesado, resultado_revenue = process_and_generate_files(df_chunk, pais, grupo, catalogs)
-                            if resultado_procesado and resultado_revenue:
-                                archivos_generados.append(resultado_procesado)
-                                archivos_generados.append(resultado_revenue)
-                    
-                    if archivos_generados:
-                        st.session_state.archivos_generados_zip = archivos_generados
-                    else:
-                        st.session_state.archivos_generados_zip = None
-                        st.warning("No se generaron archivos con los datos proporcionados.")
-
-        if st.session_state.archivos_generados_zip:
-            st.success("🎉 ¡Proceso completado! 🎉")
-            st.balloons()
-            st.header("Descargar Todos los Archivos")
-            zip_data = create_zip_buffer(st.session_state.archivos_generados_zip)
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            zip_filename = f"Reportes_ITBP_{timestamp}.zip"
-            st.download_button(
-                label=f"📦 Descargar Todo como ZIP ({len(st.session_state.archivos_generados_zip)} archivos)",
-                data=zip_data,
-                file_name=zip_filename,
-                mime="application/zip",
-                use_container_width=True
-            )
+                catalogs = load_catalogs_from_url(google_sheet_url, registro_catalogos)
+
+            if catalogs:
+                st.success("Catálogos cargados correctamente.")
+                archivos_detalle = [(file.name, file.getvalue()) for file in uploaded_files]
+                trabajo, nuevo = get_job_queue().submit(
+                    archivos_detalle, catalogs, usuario=user_info['email'], perfilar=perfilar,
+                    mediciones_previas=registro_catalogos.mediciones, perfil_previo=perfil_catalogos
+                )
+                st.session_state.trabajo_id = trabajo.id
+                if not nuevo:
+                    st.info("Estos archivos ya se enviaron con el mismo catálogo; se muestra ese trabajo en lugar de generarlos de nuevo.")
+
+        # Los trabajos siguen en el servidor aunque se recargue la página o se pierda la sesión
+        trabajos_usuario = get_job_queue().jobs(usuario=user_info['email'])
+        if trabajos_usuario:
+            with st.expander("📋 Tus trabajos recientes"):
+                st.dataframe(pd.DataFrame([{
+                    'trabajo': trabajo.id,
+                    'archivos': ", ".join(trabajo.nombres_archivos),
+                    'estado': trabajo.estado,
+                    'avance': f"{trabajo.progreso:.0%}",
+                    'enviado': datetime.fromtimestamp(trabajo.creado).strftime("%Y-%m-%d %H:%M:%S"),
+                } for trabajo in trabajos_usuario]), hide_index=True)
+                ids_trabajos = [trabajo.id for trabajo in trabajos_usuario]
+                # Sin selección si el trabajo actual no está en la lista, para no reemplazarlo por otro
+                posicion = ids_trabajos.index(st.session_state.trabajo_id) if st.session_state.trabajo_id in ids_trabajos else None
+                seleccion = st.selectbox("Ver trabajo", ids_trabajos, index=posicion)
+                if seleccion is not None:
+                    st.session_state.trabajo_id = seleccion
+
+        trabajo = get_job_queue().get(st.session_state.trabajo_id) if st.session_state.trabajo_id else None
+
+        if trabajo and trabajo.activo:
+            show_job_progress(trabajo.id)
+        elif trabajo:
+            if trabajo.resumen_lectura:
+                st.dataframe(pd.DataFrame(trabajo.resumen_lectura), hide_index=True)
+            for advertencia in trabajo.advertencias:
+                st.warning(advertencia)
+            if trabajo.pico_bytes:
+                st.info(f"Memoria pico del servidor durante la ejecución: {trabajo.pico_bytes / 1024 ** 2:,.0f} MB")
+
+            if trabajo.tiempos is not None:
+                with st.expander("⏱️ Tiempos por etapa de este trabajo"):
+                    st.dataframe(trabajo.tiempos['resumen'], hide_index=True)
+                    st.dataframe(trabajo.tiempos['detalle'], hide_index=True)
+
+            if trabajo.perfil:
+                with st.expander("🔬 Perfil cProfile de este trabajo"):
+                    st.text(trabajo.perfil['resumen'])
+                    st.download_button(
+                        label="Descargar perfil (.prof)",
+                        data=trabajo.perfil['datos'],
+                        file_name=f"perfil_{trabajo.id}.prof",
+                        mime="application/octet-stream"
+                    )
 
+            zip_generado = get_job_queue().result(trabajo.id)
+            if trabajo.estado == ERROR:
+                st.error(f"Error al generar los reportes: {trabajo.error}")
+            elif trabajo.estado == SIN_ARCHIVOS:
+                st.warning(trabajo.mensaje)
+            elif zip_generado is None:
+                st.warning("El ZIP de este trabajo ya no está disponible; vuelve a generar los reportes.")
+            else:
+                st.success("🎉 ¡Proceso completado! 🎉")
+                st.balloons()
+                st.header("Descargar Todos los Archivos")
+                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                zip_filename = f"Reportes_ITBP_{timestamp}.zip"
+                st.download_button(
+                    label=f"📦 Descargar Todo como ZIP ({zip_generado['n_archivos']} archivos)",
+                    data=zip_generado['datos'],
+                    file_name=zip_filename,
+                    mime="application/zip",
+                    use_container_width=True
+                )
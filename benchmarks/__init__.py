@@ -0,0 +1 @@
+"""Benchmarks del pipeline con entradas sintéticas (ver benchmarks.ejecutar)."""
@@ -0,0 +1,343 @@
+"""Benchmark del pipeline por etapas, con entradas sintéticas y sin acceso a la red.
+
+Uso (desde la raíz del repositorio):
+
+    python -m benchmarks.ejecutar                        # escalas por defecto, compara con el baseline
+    python -m benchmarks.ejecutar --escalas 10000 100000
+    python -m benchmarks.ejecutar --guardar-baseline     # fija los resultados actuales como baseline
+
+Para cada escala ejecuta el mismo camino que un trabajo de la app
+(aggregate_uploads sin caché de parciales, iter_templates y
+create_zip_buffer), mide tiempo de reloj, tiempo de CPU, filas por segundo
+y pico de RSS de cada etapa, muestra el desglose por sub-etapa que registra
+el StageRecorder y calcula una huella de las plantillas generadas.
+Una etapa es una regresión si tarda o consume más que el baseline de la
+misma escala por encima de la tolerancia; una huella distinta indica que
+cambió la salida. Hasta --max-filas-referencia el detalle se reparte en
+varios archivos (para ejercitar la combinación de parciales), se ejecuta la
+versión original (benchmarks.referencia) y se comparan con ella las
+plantillas y los XLSX del ZIP, tanto de la ejecución medida como de una
+ejecución adicional con el otro modo (con pool si la medida fue en un solo
+proceso, y viceversa).
+Termina con código 1 si hay regresiones o diferencias de salida.
+
+Los tiempos dependen de la máquina: el baseline debe generarse en el mismo
+equipo en el que se compara.
+"""
+import argparse
+import hashlib
+import io
+import json
+import zipfile
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from benchmarks import referencia, sintetico
+from itbp.catalogos import build_catalog_indexes, parse_catalog_workbook
+from itbp.escritura import create_zip_buffer, to_excel_buffer, write_xlsx_bytes
+from itbp.incremental import aggregate_uploads
+from itbp.instrumentacion import StageRecorder
+from itbp.memoria import PeakMemoryMonitor
+from itbp.motor import iter_templates
+from itbp.paralelo import job_pool
+
+# 'ingesta' abarca lectura, ajustes, totalización por archivo y consolidación; 'zip' incluye escribir los XLSX
+ETAPAS = ['catalogos', 'ingesta', 'plantillas', 'zip']
+ESCALAS_DEFECTO = [10_000, 100_000, 1_000_000, 5_000_000]
+RUTA_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+DIRECTORIO_DATOS = os.path.join(tempfile.gettempdir(), 'itbp_bench')
+TOLERANCIA = 0.25
+# Diferencias absolutas por debajo de estos mínimos se consideran ruido de medición
+MINIMO_SEGUNDOS = 0.25
+MINIMO_BYTES = 32 * 1024 ** 2
+MAX_FILAS_REFERENCIA = 200_000
+# Hasta MAX_FILAS_REFERENCIA el detalle se reparte en esta cantidad de archivos
+ARCHIVOS_REFERENCIA = 4
+# Procesos de la ejecución de equivalencia con pool cuando la medida usa uno solo
+WORKERS_EQUIVALENCIA = 2
+# Se compara la medición más rápida de cada etapa entre estas ejecuciones
+REPETICIONES = 3
+
+
+def load_inputs(filas, n_comercios, dias, directorio, filas_por_archivo=sintetico.FILAS_POR_ARCHIVO):
+    """Catálogo y archivos de detalle sintéticos; se guardan en `directorio` para no regenerarlos."""
+    carpeta = os.path.join(directorio, f"filas{filas}_comercios{n_comercios}_dias{dias}_archivo{filas_por_archivo}")
+    indice = os.path.join(carpeta, 'archivos.json')
+    if os.path.exists(indice):
+        with open(indice, encoding='utf-8') as f:
+            nombres = json.load(f)
+        with open(os.path.join(carpeta, 'catalogos.xlsx'), 'rb') as f:
+            contenido_catalogo = f.read()
+        archivos = []
+        for nombre in nombres:
+            with open(os.path.join(carpeta, nombre), 'rb') as f:
+                archivos.append((nombre, f.read()))
+        return contenido_catalogo, archivos
+
+    contenido_catalogo = sintetico.catalog_workbook(n_comercios)
+    archivos = sintetico.detail_workbooks(filas, n_comercios=n_comercios, dias=dias, filas_por_archivo=filas_por_archivo)
+    os.makedirs(carpeta, exist_ok=True)
+    with open(os.path.join(carpeta, 'catalogos.xlsx'), 'wb') as f:
+        f.write(contenido_catalogo)
+    for nombre, contenido in archivos:
+        with open(os.path.join(carpeta, nombre), 'wb') as f:
+            f.write(contenido)
+    # El índice se escribe al final: su presencia indica que el juego de datos está completo
+    with open(indice, 'w', encoding='utf-8') as f:
+        json.dump([nombre for nombre, _ in archivos], f)
+    return contenido_catalogo, archivos
+
+
+def _measure(filas, funcion, *args):
+    """Ejecuta `funcion(*args)` y devuelve (resultado, métricas de la etapa)."""
+    with PeakMemoryMonitor() as monitor:
+        inicio, inicio_cpu = time.perf_counter(), time.process_time()
+        resultado = funcion(*args)
+        segundos = time.perf_counter() - inicio
+        cpu_segundos = time.process_time() - inicio_cpu
+    return resultado, {
+        'segundos': segundos,
+        'cpu_segundos': cpu_segundos,
+        'filas': filas,
+        'filas_por_segundo': filas / segundos if segundos > 0 else 0.0,
+        'pico_bytes': monitor.pico_bytes,
+    }
+
+
+def _build_templates(df_totalizado, particiones, catalogs, pool, registro):
+    archivos_generados = []
+    for _, _, resultado_procesado, resultado_revenue in iter_templates(df_totalizado, particiones, catalogs, pool=pool, registro=registro):
+        if resultado_procesado and resultado_revenue:
+            archivos_generados.append(resultado_procesado)
+            archivos_generados.append(resultado_revenue)
+    return archivos_generados
+
+
+def run_pipeline(contenido_catalogo, archivos, max_workers=1):
+    """Ejecuta el pipeline de un trabajo de la app, sin caché de parciales.
+
+    Devuelve (archivos_generados, bytes del ZIP, métricas por etapa, desglose
+    por sub-etapa del StageRecorder).
+    """
+    etapas = {}
+    registro = StageRecorder(emitir=False)
+    catalogs, etapas['catalogos'] = _measure(0, lambda: build_catalog_indexes(parse_catalog_workbook(contenido_catalogo)))
+    etapas['catalogos']['filas'] = len(catalogs['itbp'])
+    # Igual que en la app, un solo pool para todas las etapas
+    with job_pool(max_workers, catalogs) as pool:
+        (df_totalizado, particiones, resumen), etapas['ingesta'] = _measure(0, aggregate_uploads, archivos, catalogs, None, pool, registro)
+        etapas['ingesta']['filas'] = sum(fila['filas'] for fila in resumen)
+        archivos_generados, etapas['plantillas'] = _measure(len(df_totalizado), _build_templates, df_totalizado, particiones, catalogs, pool, registro)
+        filas_salida = sum(len(df) for _, df in archivos_generados)
+        datos_zip, etapas['zip'] = _measure(filas_salida, create_zip_buffer, archivos_generados, pool, registro)
+    for etapa in etapas.values():
+        etapa['filas_por_segundo'] = etapa['filas'] / etapa['segundos'] if etapa['segundos'] > 0 else 0.0
+    return archivos_generados, datos_zip, etapas, registro.summary()
+
+
+def output_digest(archivos_generados):
+    """Huella de las plantillas: nombres, columnas y contenido de cada una, en orden."""
+    huella = hashlib.sha256()
+    for nombre, df in archivos_generados:
+        huella.update(nombre.encode('utf-8'))
+        huella.update(df.to_csv(index=False).encode('utf-8'))
+    return huella.hexdigest()
+
+
+def compare_outputs(esperado, obtenido):
+    """Diferencias entre dos listas de (nombre, dataframe), incluido el tipo de cada celda."""
+    diferencias = []
+    nombres_esperados = [nombre for nombre, _ in esperado]
+    nombres_obtenidos = [nombre for nombre, _ in obtenido]
+    if nombres_esperados != nombres_obtenidos:
+        return [f"archivos distintos: esperados {nombres_esperados}, obtenidos {nombres_obtenidos}"]
+    for (nombre, df_esperado), (_, df_obtenido) in zip(esperado, obtenido):
+        try:
+            pd.testing.assert_frame_equal(df_esperado, df_obtenido, check_exact=True)
+        except AssertionError as e:
+            diferencias.append(f"{nombre}: {str(e).splitlines()[0]}")
+            continue
+        tipos_esperados = df_esperado.map(type).to_numpy()
+        tipos_obtenidos = df_obtenido.map(type).to_numpy()
+        if (tipos_esperados != tipos_obtenidos).any():
+            diferencias.append(f"{nombre}: tipos de celda distintos")
+    return diferencias
+
+
+def read_zip(datos_zip):
+    """Lista de (nombre, dataframe) con los libros del ZIP leídos de vuelta, en orden."""
+    with zipfile.ZipFile(io.BytesIO(datos_zip)) as archivo_zip:
+        return [(nombre, pd.read_excel(io.BytesIO(archivo_zip.read(nombre)))) for nombre in archivo_zip.namelist()]
+
+
+def compare_workbooks(archivos_generados, libros_zip):
+    """Diferencias entre los libros del ZIP y lo que escribe to_excel_buffer con las mismas plantillas, leídos de vuelta.
+
+    Además se compara write_xlsx_bytes con to_excel_buffer en un libro con
+    valores de borde (sintetico.edge_case_frame).
+    """
+    esperado = [(nombre, pd.read_excel(io.BytesIO(to_excel_buffer(df)))) for nombre, df in archivos_generados]
+    diferencias = [f"{diferencia} (xlsx)" for diferencia in compare_outputs(esperado, libros_zip)]
+    df_borde = sintetico.edge_case_frame()
+    try:
+        pd.testing.assert_frame_equal(pd.read_excel(io.BytesIO(to_excel_buffer(df_borde))), pd.read_excel(io.BytesIO(write_xlsx_bytes(df_borde))), check_exact=True)
+    except AssertionError as e:
+        diferencias.append(f"casos_borde.xlsx (xlsx): {str(e).splitlines()[0]}")
+    return diferencias
+
+
+def run_scale(filas, args):
+    con_referencia = filas <= args.max_filas_referencia
+    # Con varios archivos la comparación cubre la combinación de parciales y el orden de particiones entre archivos
+    filas_por_archivo = -(-filas // ARCHIVOS_REFERENCIA) if con_referencia else sintetico.FILAS_POR_ARCHIVO
+    contenido_catalogo, archivos = load_inputs(filas, args.comercios, args.dias, args.directorio_datos, filas_por_archivo)
+    mejores = None
+    huellas = set()
+    for _ in range(args.repeticiones):
+        archivos_generados, datos_zip, etapas, desglose = run_pipeline(contenido_catalogo, archivos, max_workers=args.workers)
+        huellas.add(output_digest(archivos_generados))
+        # Con varias repeticiones se conserva la medición más rápida de cada etapa y, aparte, su menor
+        # pico de RSS: el RSS no baja entre repeticiones, así que el de la más rápida puede ser mayor
+        mejores = etapas if mejores is None else {
+            nombre: dict(
+                min(mejores[nombre], etapas[nombre], key=lambda etapa: etapa['segundos']),
+                pico_bytes=min(mejores[nombre]['pico_bytes'], etapas[nombre]['pico_bytes']),
+            ) for nombre in ETAPAS
+        }
+    resultado = {
+        'filas': filas,
+        'archivos_entrada': len(archivos),
+        'archivos_salida': len(archivos_generados),
+        'segundos': sum(etapa['segundos'] for etapa in mejores.values()),
+        'pico_bytes': max(etapa['pico_bytes'] for etapa in mejores.values()),
+        'etapas': mejores,
+        # Desglose de la última repetición; en el pool suma el tiempo de todos los procesos
+        'desglose': json.loads(desglose[['etapa', 'mediciones', 'segundos', 'cpu_segundos']].to_json(orient='records')),
+        'huella': next(iter(huellas)) if len(huellas) == 1 else None,
+        'diferencias': [] if len(huellas) == 1 else ['la salida cambió entre repeticiones'],
+    }
+    resultado['referencia'] = con_referencia
+    if con_referencia:
+        esperado = referencia.run_reference(contenido_catalogo, archivos)
+        libros_zip = read_zip(datos_zip)
+        resultado['diferencias'] += compare_outputs(esperado, archivos_generados)
+        resultado['diferencias'] += compare_workbooks(archivos_generados, libros_zip)
+        # El otro modo de ejecución (pool o un solo proceso) también debe reproducir la referencia
+        otros_workers = 1 if args.workers > 1 else WORKERS_EQUIVALENCIA
+        archivos_otro, datos_zip_otro, _, _ = run_pipeline(contenido_catalogo, archivos, max_workers=otros_workers)
+        resultado['diferencias'] += [
+            f"con {otros_workers} proceso(s): {diferencia}"
+            for diferencia in compare_outputs(esperado, archivos_otro) + compare_outputs(libros_zip, read_zip(datos_zip_otro))
+        ]
+        resultado['workers_equivalencia'] = sorted({args.workers, otros_workers})
+    return resultado
+
+
+def find_regressions(resultado, base, tolerancia):
+    """Mensajes por cada etapa más lenta o con más memoria que `base`, y por cambio de huella."""
+    regresiones = []
+    if base.get('huella') and resultado['huella'] and base['huella'] != resultado['huella']:
+        regresiones.append("la salida difiere de la registrada en el baseline")
+    for nombre in ETAPAS:
+        actual, previo = resultado['etapas'][nombre], base.get('etapas', {}).get(nombre)
+        if not previo:
+            continue
+        if actual['segundos'] > previo['segundos'] * (1 + tolerancia) and actual['segundos'] - previo['segundos'] > MINIMO_SEGUNDOS:
+            regresiones.append(f"{nombre}: {actual['segundos']:.2f}s contra {previo['segundos']:.2f}s del baseline")
+        if actual['pico_bytes'] > previo['pico_bytes'] * (1 + tolerancia) and actual['pico_bytes'] - previo['pico_bytes'] > MINIMO_BYTES:
+            regresiones.append(f"{nombre}: pico {actual['pico_bytes'] / 1024 ** 2:,.0f} MB contra {previo['pico_bytes'] / 1024 ** 2:,.0f} MB del baseline")
+    return regresiones
+
+
+def format_table(resultado, base):
+    filas_tabla = []
+    for nombre in ETAPAS:
+        etapa = resultado['etapas'][nombre]
+        previo = (base or {}).get('etapas', {}).get(nombre)
+        filas_tabla.append({
+            'etapa': nombre,
+            'segundos': round(etapa['segundos'], 3),
+            'cpu': round(etapa['cpu_segundos'], 3),
+            'filas': etapa['filas'],
+            'filas/s': round(etapa['filas_por_segundo']),
+            'pico MB': round(etapa['pico_bytes'] / 1024 ** 2),
+            'vs baseline': f"{etapa['segundos'] / previo['segundos'] - 1:+.0%}" if previo and previo['segundos'] > 0 else '',
+        })
+    return pd.DataFrame(filas_tabla).to_string(index=False)
+
+
+def format_breakdown(resultado):
+    return pd.DataFrame(resultado['desglose']).round(3).to_string(index=False)
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'plataforma': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.ejecutar', description="Benchmark por etapas del generador de plantillas ITBP.")
+    parser.add_argument('--escalas', type=int, nargs='+', default=ESCALAS_DEFECTO, help="cantidades de filas de detalle a medir")
+    parser.add_argument('--comercios', type=int, default=500, help="comercios en el catálogo ITBP")
+    parser.add_argument('--dias', type=int, default=31, help="días que abarca el detalle")
+    parser.add_argument('--workers', type=int, default=1, help="procesos del pool compartido por ingesta, plantillas y ZIP")
+    parser.add_argument('--repeticiones', type=int, default=REPETICIONES, help="ejecuciones por escala; se toma la más rápida de cada etapa")
+    parser.add_argument('--tolerancia', type=float, default=TOLERANCIA, help="aumento relativo admitido antes de marcar regresión")
+    parser.add_argument('--max-filas-referencia', type=int, default=MAX_FILAS_REFERENCIA, help="escala máxima en la que se compara con la versión original")
+    parser.add_argument('--baseline', default=RUTA_BASELINE, help="archivo JSON con los resultados de referencia")
+    parser.add_argument('--guardar-baseline', action='store_true', help="guarda los resultados de esta ejecución como baseline")
+    parser.add_argument('--salida', help="archivo JSON donde guardar los resultados")
+    parser.add_argument('--directorio-datos', default=DIRECTORIO_DATOS, help="carpeta para los datos sintéticos generados")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        baseline = {'entorno': None, 'escalas': {}}
+
+    resultados = {'entorno': environment(), 'escalas': {}}
+    con_problemas = False
+    for filas in args.escalas:
+        print(f"\n=== {filas:,} filas ===", flush=True)
+        resultado = run_scale(filas, args)
+        resultados['escalas'][str(filas)] = resultado
+        base = baseline['escalas'].get(str(filas))
+        print(format_table(resultado, base))
+        print("desglose:")
+        print(format_breakdown(resultado))
+        print(f"total {resultado['segundos']:.2f}s | pico {resultado['pico_bytes'] / 1024 ** 2:,.0f} MB | "
+              f"{resultado['archivos_entrada']} archivos de detalle | {resultado['archivos_salida']} plantillas | referencia: "
+              + (f"sí, con {' y '.join(map(str, resultado['workers_equivalencia']))} procesos" if resultado['referencia'] else 'omitida'))
+        problemas = resultado['diferencias'] + (find_regressions(resultado, base, args.tolerancia) if base else [])
+        for problema in problemas:
+            print(f"  REGRESIÓN: {problema}")
+        con_problemas = con_problemas or bool(problemas)
+
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as f:
+            json.dump(resultados, f, indent=2, ensure_ascii=False)
+    if args.guardar_baseline:
+        # Las escalas no medidas en esta ejecución conservan su baseline anterior
+        baseline['entorno'] = resultados['entorno']
+        baseline['escalas'].update(resultados['escalas'])
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, indent=2, ensure_ascii=False)
+        print(f"\nBaseline guardado en {args.baseline}")
+    return 1 if con_problemas else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
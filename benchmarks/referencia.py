@@ -0,0 +1,124 @@
+"""Implementación original del pipeline, congelada como referencia de equivalencia.
+
+Reproduce la versión de la app previa a las optimizaciones (lectura completa
+de cada archivo, get_output_group_date fila por fila y una pasada de cruce,
+totalización y armado por cada partición país/grupo). No debe modificarse:
+las salidas de la versión actual se comparan contra las de este módulo.
+"""
+import io
+
+import numpy as np
+import pandas as pd
+
+COLUMNAS_PROCESADO = ['Tipo mov.','Nº cuenta','Fecha registro','Tipo documento','Nº documento','Descripción','Importe','Importe debe','Importe haber','Cód. términos pago','Tipo de registro gen.','Nº documento externo','PostingGroup2','Prepayment','Tipo contrapartida','Cta. Contrapartida','DIM 1','DIM 2','DIM 3','DIM 4','DIM 5','DIM 6','DIM 7','DIM 8','VAT\xa0Registration\xa0Type\xa0KCP','VAT\xa0Registration\xa0No."','Cód. divisa']
+COLUMNAS_REVENUE = COLUMNAS_PROCESADO
+TIPOS_DEBE = ['REVERSE','CHARGEBACK','VOID','REFUND']
+
+
+def get_output_group_date(date):
+    if date.weekday() >= 4:
+        return (date + pd.Timedelta(days=6 - date.weekday())).date()
+    else:
+        return date.date()
+
+
+def load_catalogs(contenido):
+    file_content = io.BytesIO(contenido)
+    catalogs = {
+        'itbp': pd.read_excel(file_content, sheet_name='ITBP', engine='openpyxl'),
+        'txn': pd.read_excel(file_content, sheet_name='Transaction Type', engine='openpyxl'),
+        'procesadora': pd.read_excel(file_content, sheet_name='Procesadora', engine='openpyxl')
+    }
+    if 'Pais' in catalogs['procesadora'].columns:
+        catalogs['procesadora'].rename(columns={'Pais': 'País'}, inplace=True)
+    return catalogs
+
+
+def process_and_generate_files(df_chunk, pais_actual, grupo_fecha, catalogs):
+    df_catalogo_itbp = catalogs['itbp']
+    df_catalogo_txn = catalogs['txn']
+    df_catalogo_procesadora = catalogs['procesadora']
+    df_cuentas_pais = df_catalogo_procesadora[df_catalogo_procesadora['País'].str.upper() == pais_actual.upper()]
+    if df_cuentas_pais.empty:
+        return None, None
+    cuenta_procesadora = df_cuentas_pais.iloc[0]['Cuenta Contrapartida']
+    Tipo_mtvo_procesadora = df_cuentas_pais.iloc[0]['Tipo mov. Contrapartida']
+    VAT_Registration_Type_KCP = df_cuentas_pais.iloc[0]['VAT\xa0Registration\xa0Type\xa0KCP']
+    VAT_Registration_No = df_cuentas_pais.iloc[0]['VAT\xa0Registration\xa0No."']
+    df_filtrado = pd.merge(df_chunk, df_catalogo_itbp, on='merchant_id', how='inner')
+    for col in ['approved_transaction_amount','kushki_commission','iva_kushki_commission']:
+        if col in df_filtrado.columns:
+            df_filtrado[col] = pd.to_numeric(df_filtrado[col], errors='coerce').fillna(0)
+    df_totalizado = df_filtrado.groupby(['fecha_pago','createddate','merchant_id','merchant_name','currency_code','RUC_Contable_ITBP','PostingGroup2_proveedor','VAT Registration Type KCP Revenue','VAT Registration No.Revenue','TipoMovimientoCXP','DIM2','DIM3','DIM4','payment_method','transaction_type','TipoMovimientoIng','CuentaIng','CuentaIva','processor_name'], dropna=False).agg(total_approved_amount=pd.NamedAgg(column='approved_transaction_amount', aggfunc='sum'),total_kushki_commission=pd.NamedAgg(column='kushki_commission', aggfunc='sum'),total_iva_kushki_commission=pd.NamedAgg(column='iva_kushki_commission', aggfunc='sum')).reset_index()
+    df_totalizado['payment_method'] = df_totalizado['payment_method'].str.upper()
+    df_final = pd.merge(df_totalizado, df_catalogo_txn, on='transaction_type', how='left')
+    df_final['createddate'] = pd.to_datetime(df_final['createddate'])
+    df_final['Nº documento'] = 'W' + df_final['createddate'].dt.isocalendar().week.astype(str).str.zfill(2) + '-' + df_final['createddate'].dt.strftime('%y')
+    if pais_actual.upper() in ['CHILE','CHILE OPERADORA']:
+        dim3_valor, dim7_valor = '', df_final['DIM3']
+    else:
+        dim3_valor, dim7_valor = df_final['DIM3'], ''
+    es_debe = df_final['transaction_type'].isin(TIPOS_DEBE)
+    divisa = np.where((df_final['currency_code'] == 'USD') & (pais_actual.upper() == 'PERU'), df_final['currency_code'], '')
+    tipo_registro = 'Compra' if pais_actual.upper() == 'PERU' else ''
+    df_procesado = pd.DataFrame()
+    df_procesado['Tipo mov.'] = df_final['TipoMovimientoCXP']
+    df_procesado['Nº cuenta'] = df_final['RUC_Contable_ITBP']
+    df_procesado['Fecha registro'] = df_final['createddate'].dt.strftime('%d/%m/%Y')
+    df_procesado['Nº documento'] = df_final['Nº documento']
+    df_procesado['Descripción'] = df_final['descripcion_txn'].fillna('') + ' ' + df_final['merchant_name'].fillna('')
+    df_procesado['Importe debe'] = np.where(es_debe, df_final['total_approved_amount'], 0)
+    df_procesado['Importe haber'] = np.where(~es_debe, df_final['total_approved_amount'], 0)
+    df_procesado['Nº documento externo'] = df_final['fecha_pago'].dt.strftime('%d/%m/%Y')
+    df_procesado['PostingGroup2'] = df_final['PostingGroup2_proveedor']
+    df_procesado['DIM 2'] = df_final['DIM2']
+    df_procesado['DIM 3'] = dim3_valor
+    df_procesado['DIM 4'] = df_final['DIM4']
+    df_procesado['DIM 7'] = dim7_valor
+    df_procesado['Cód. divisa'] = divisa
+    df_procesado['descripcion_txn'] = df_final['descripcion_txn']
+    df_procesado = df_procesado[(df_procesado['Importe debe'] != 0) | (df_procesado['Importe haber'] != 0)].copy()
+    resumen_por_fecha = df_procesado.groupby(['Fecha registro','Nº documento','descripcion_txn','Cód. divisa']).agg(total_debe=('Importe debe', 'sum'), total_haber=('Importe haber', 'sum')).reset_index()
+    nuevas_filas_resumen = []
+    doc_externo_contrapartida = '169922' if pais_actual.upper() == 'PERU' else ''
+    for _, fila in resumen_por_fecha.iterrows():
+        if fila['total_debe'] != 0 or fila['total_haber'] != 0:
+            nuevas_filas_resumen.append({'Tipo mov.': Tipo_mtvo_procesadora,'Nº cuenta': cuenta_procesadora,'Fecha registro': fila['Fecha registro'],'Nº documento': fila['Nº documento'],'Descripción': f"{fila['descripcion_txn']} KUSHKI ACQUIRER PROCESSOR",'Importe debe': fila['total_haber'],'Importe haber': fila['total_debe'],'Nº documento externo': doc_externo_contrapartida,'VAT\xa0Registration\xa0Type\xa0KCP': VAT_Registration_Type_KCP,'VAT\xa0Registration\xa0No."': VAT_Registration_No,'Cód. divisa': fila['Cód. divisa']})
+    df_procesado.drop(columns=['descripcion_txn'], inplace=True)
+    df_contrapartidas_proc = pd.DataFrame(nuevas_filas_resumen)
+    lineas_revenue = []
+    for cuenta, descripcion, columna_monto in [('CuentaIng', 'REVENUE ', 'total_kushki_commission'), ('CuentaIva', 'IVA REVENUE ', 'total_iva_kushki_commission')]:
+        lineas_revenue.append(pd.DataFrame({'Tipo mov.': df_final['TipoMovimientoIng'],'Nº cuenta': df_final[cuenta],'Fecha registro': df_final['createddate'].dt.strftime('%d/%m/%Y'),'Nº documento': df_final['Nº documento'],'Descripción': descripcion + df_final['merchant_name'].fillna(''),'Importe debe': np.where(es_debe, df_final[columna_monto], 0),'Importe haber': np.where(~es_debe, df_final[columna_monto], 0),'Tipo de registro gen.': tipo_registro,'Nº documento externo' : df_final['fecha_pago'].dt.strftime('%d/%m/%Y'),'PostingGroup2': df_final['PostingGroup2_proveedor'],'Tipo contrapartida': df_final['TipoMovimientoCXP'],'Cta. Contrapartida': df_final['RUC_Contable_ITBP'],'DIM 2': df_final['DIM2'],'DIM 3': dim3_valor,'DIM 4': df_final['DIM4'],'DIM 7': dim7_valor,'VAT\xa0Registration\xa0Type\xa0KCP': df_final['VAT Registration Type KCP Revenue'],'VAT\xa0Registration\xa0No."': df_final['VAT Registration No.Revenue'],'Cód. divisa': divisa}))
+    df_reporte_procesado = pd.concat([df_procesado, df_contrapartidas_proc], ignore_index=True).reindex(columns=COLUMNAS_PROCESADO).fillna('')
+    df_reporte_revenue = pd.concat(lineas_revenue, ignore_index=True)
+    df_reporte_revenue = df_reporte_revenue[(df_reporte_revenue['Importe debe'] != 0) | (df_reporte_revenue['Importe haber'] != 0)].copy()
+    df_reporte_revenue = df_reporte_revenue.reindex(columns=COLUMNAS_REVENUE).fillna('')
+    for df in [df_reporte_procesado, df_reporte_revenue]:
+        df['Importe debe'] = df['Importe debe'].replace(0, '')
+        df['Importe haber'] = df['Importe haber'].replace(0, '')
+    fecha_contable_str = grupo_fecha.strftime("%Y%m%d")
+    nombre_archivo_procesado = f"Procesado_{pais_actual}_{fecha_contable_str}.xlsx"
+    nombre_archivo_revenue = f"Revenue_{pais_actual}_{fecha_contable_str}.xlsx"
+    return (nombre_archivo_procesado, df_reporte_procesado), (nombre_archivo_revenue, df_reporte_revenue)
+
+
+def run_reference(contenido_catalogo, archivos):
+    """Ejecuta el pipeline original sobre (nombre, bytes) y devuelve la lista de (nombre_archivo, dataframe)."""
+    catalogs = load_catalogs(contenido_catalogo)
+    df_consolidado = pd.concat([pd.read_excel(io.BytesIO(contenido)) for _, contenido in archivos], ignore_index=True)
+    condicion_descarte_mid = (df_consolidado['merchant_id'] == '20000000107065050000') & (df_consolidado['processor_name'].str.strip().str.upper() != 'KUSHKI ACQUIRER PROCESSOR')
+    df_consolidado = df_consolidado[~condicion_descarte_mid].copy()
+    condicion_kushki = (df_consolidado['country'].str.strip().str.upper() == 'CHILE') & (df_consolidado['processor_name'].str.strip().str.upper() == 'KUSHKI ACQUIRER PROCESSOR')
+    df_consolidado.loc[condicion_kushki, 'country'] = 'Chile Operadora'
+    df_consolidado['createddate'] = pd.to_datetime(df_consolidado['createddate'])
+    df_consolidado['fecha_pago'] = pd.to_datetime(df_consolidado['fecha_pago'], errors='coerce')
+    df_consolidado['output_group'] = df_consolidado['createddate'].apply(get_output_group_date)
+    archivos_generados = []
+    for pais in df_consolidado['country'].unique():
+        df_pais = df_consolidado[df_consolidado['country'] == pais].copy()
+        for grupo in df_pais['output_group'].unique():
+            resultado_procesado, resultado_revenue = process_and_generate_files(df_pais[df_pais['output_group'] == grupo], pais, grupo, catalogs)
+            if resultado_procesado and resultado_revenue:
+                archivos_generados.append(resultado_procesado)
+                archivos_generados.append(resultado_revenue)
+    return archivos_generados
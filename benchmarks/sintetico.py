@@ -0,0 +1,153 @@
+"""Generador de entradas sintéticas: libro de catálogos y archivos Detalle_liquidación."""
+import io
+
+import numpy as np
+import pandas as pd
+
+from itbp.escritura import write_xlsx_bytes
+from itbp.motor import MID_DESCARTE
+
+# País → monedas posibles. México no tiene cuentas en Procesadora (ejercita la ruta de omisión)
+MONEDAS_PAIS = {
+    'Chile': ['CLP'],
+    'Peru': ['PEN', 'USD'],
+    'Colombia': ['COP'],
+    'Ecuador': ['USD'],
+    'Mexico': ['MXN'],
+}
+PAISES_CON_CUENTAS = ['CHILE', 'Chile Operadora', 'PERU', 'Colombia', 'Ecuador']
+# Tipo de transacción → descripción del catálogo (CAPTURE sin descripción, UNKNOWN fuera del catálogo)
+TIPOS_TRANSACCION = {
+    'SALE': 'VENTA',
+    'REFUND': 'DEVOLUCION',
+    'VOID': 'ANULACION',
+    'CHARGEBACK': 'CONTRACARGO',
+    'REVERSE': 'REVERSO',
+    'CAPTURE': None,
+}
+PROCESADORES = ['Kushki Acquirer Processor', 'Procesador Externo', ' kushki acquirer processor ']
+METODOS_PAGO = ['card', 'transfer', 'cash', None]
+# Columnas que trae el export real pero que el pipeline no usa
+COLUMNAS_SOBRANTES = ['ticket_number', 'card_brand']
+# Un xlsx admite 1.048.576 filas; las escalas mayores se reparten en varios archivos
+FILAS_POR_ARCHIVO = 500_000
+
+
+def merchant_ids(n_comercios):
+    """MIDs de 20 dígitos como texto, más el MID que solo se conserva con Kushki Acquirer Processor."""
+    return [f"{20000000100000000000 + i}" for i in range(n_comercios)] + [MID_DESCARTE]
+
+
+def catalog_frames(n_comercios=500, seed=0):
+    """Hojas ITBP, Transaction Type y Procesadora para los MIDs de merchant_ids(n_comercios)."""
+    rng = np.random.default_rng(seed)
+    mids = merchant_ids(n_comercios)
+    n = len(mids)
+    itbp = pd.DataFrame({
+        'merchant_id': mids,
+        'RUC_Contable_ITBP': [f"PRV{i:06d}" for i in range(n)],
+        'PostingGroup2_proveedor': rng.choice(['NACIONAL', 'EXTRANJERO'], n),
+        'VAT Registration Type KCP Revenue': rng.choice(['RUC', 'NIT', None], n),
+        'VAT Registration No.Revenue': [f"{1790000000001 + i}" for i in range(n)],
+        'TipoMovimientoCXP': 'Proveedor',
+        'DIM2': rng.choice(['COMERCIAL', 'OPERACIONES'], n),
+        'DIM3': rng.choice(['RETAIL', 'SERVICIOS', None], n),
+        'DIM4': rng.choice(['ONLINE', 'PRESENCIAL'], n),
+        'TipoMovimientoIng': 'Cuenta',
+        'CuentaIng': rng.integers(410000, 419999, n),
+        'CuentaIva': rng.integers(240000, 249999, n),
+    })
+    txn = pd.DataFrame({'transaction_type': list(TIPOS_TRANSACCION), 'descripcion_txn': list(TIPOS_TRANSACCION.values())})
+    procesadora = pd.DataFrame({
+        # La segunda fila de Peru no debe usarse: gana la primera de cada país
+        'Pais': PAISES_CON_CUENTAS + ['Peru'],
+        'Cuenta Contrapartida': [f"1101{i:02d}" for i in range(len(PAISES_CON_CUENTAS) + 1)],
+        'Tipo mov. Contrapartida': 'Banco',
+        'VAT\xa0Registration\xa0Type\xa0KCP': ['RUT', None, 'RUC', 'NIT', 'RUC', 'RUC'],
+        'VAT\xa0Registration\xa0No."': ['76000000', '76000001', '20600000001', None, '1790000000001', '20600000002'],
+    })
+    return itbp, txn, procesadora
+
+
+def catalog_workbook(n_comercios=500, seed=0):
+    """Libro de catálogos (bytes) con las tres hojas que descarga la app."""
+    itbp, txn, procesadora = catalog_frames(n_comercios, seed)
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        itbp.to_excel(writer, sheet_name='ITBP', index=False)
+        txn.to_excel(writer, sheet_name='Transaction Type', index=False)
+        procesadora.to_excel(writer, sheet_name='Procesadora', index=False)
+    return output.getvalue()
+
+
+def detail_frame(filas, n_comercios=500, dias=31, inicio='2025-03-01', seed=1):
+    """Detalle_liquidación sintético con los casos que ajusta el pipeline.
+
+    Un 10 % de las filas usa comercios ausentes del catálogo ITBP; Chile mezcla
+    filas de Kushki Acquirer Processor (que pasan a 'Chile Operadora'); el MID
+    de descarte aparece con distintos procesadores; algunos montos vienen en
+    cero o como texto y algunas fechas de pago vienen vacías.
+    """
+    rng = np.random.default_rng(seed)
+    # Cada comercio tiene país y nombre fijos, como en el export real
+    mids = np.array(merchant_ids(int(n_comercios * 1.1)), dtype=object)
+    paises = np.array(list(MONEDAS_PAIS), dtype=object)
+    pais_comercio = rng.choice(paises, len(mids))
+    nombre_comercio = np.array([f"COMERCIO {i}" for i in range(len(mids))], dtype=object)
+    nombre_comercio[rng.random(len(mids)) < 0.02] = None
+
+    comercio = rng.integers(0, len(mids), filas)
+    pais = pais_comercio[comercio]
+    moneda = np.empty(filas, dtype=object)
+    for nombre_pais, monedas in MONEDAS_PAIS.items():
+        en_pais = pais == nombre_pais
+        moneda[en_pais] = rng.choice(monedas, int(en_pais.sum()))
+
+    segundos = rng.integers(0, dias * 24 * 3600, filas)
+    createddate = pd.Timestamp(inicio) + pd.to_timedelta(np.sort(segundos), unit='s')
+    fecha_pago = (createddate.normalize() + pd.to_timedelta(rng.integers(1, 6, filas), unit='D')).strftime('%Y-%m-%d').to_numpy(dtype=object)
+    fecha_pago[rng.random(filas) < 0.01] = None
+
+    tipos = np.array(list(TIPOS_TRANSACCION) + ['UNKNOWN'], dtype=object)
+    monto = np.round(rng.uniform(1, 500, filas), 2)
+    monto[rng.random(filas) < 0.03] = 0
+    comision = np.round(monto * 0.03, 2).astype(object)
+    comision[rng.random(filas) < 0.005] = 'N/A'
+
+    return pd.DataFrame({
+        'id': np.arange(1, filas + 1),
+        'merchant_id': mids[comercio],
+        'merchant_name': nombre_comercio[comercio],
+        'country': pais,
+        'processor_name': rng.choice(np.array(PROCESADORES, dtype=object), filas, p=[0.5, 0.4, 0.1]),
+        'currency_code': moneda,
+        'payment_method': rng.choice(np.array(METODOS_PAGO, dtype=object), filas),
+        'transaction_type': rng.choice(tipos, filas, p=[0.8, 0.06, 0.04, 0.02, 0.03, 0.04, 0.01]),
+        'createddate': createddate.strftime('%Y-%m-%d %H:%M:%S'),
+        'fecha_pago': fecha_pago,
+        'approved_transaction_amount': monto,
+        'kushki_commission': comision,
+        'iva_kushki_commission': np.round(monto * 0.0036, 2),
+        'ticket_number': rng.integers(10 ** 9, 10 ** 10, filas),
+        'card_brand': rng.choice(np.array(['VISA', 'MASTERCARD', 'AMEX'], dtype=object), filas),
+    })
+
+
+def edge_case_frame():
+    """Valores de celda poco comunes (±inf, nulos, cadenas vacías, fechas) para comparar los escritores de XLSX."""
+    return pd.DataFrame({
+        'Importe': [1.5, np.inf, -np.inf, np.nan, 0.0],
+        'Entero': [1, 2, 3, 4, 5],
+        'Texto': ['A', '', None, 'inf', '=1+1'],
+        'Fecha': pd.to_datetime(['2025-03-01 00:00:00', None, '2025-03-02 10:30:00', '2025-03-03 00:00:00', '2025-03-04 00:00:00']),
+        'Mixta': [1, 'texto', np.inf, None, pd.Timestamp('2025-03-05').date()],
+    })
+
+
+def detail_workbooks(filas, n_comercios=500, dias=31, seed=1, filas_por_archivo=FILAS_POR_ARCHIVO):
+    """Lista de (nombre, bytes) con `filas` en total, repartidas en archivos de hasta `filas_por_archivo`."""
+    archivos = []
+    for i, inicio in enumerate(range(0, filas, filas_por_archivo)):
+        df = detail_frame(min(filas_por_archivo, filas - inicio), n_comercios=n_comercios, dias=dias, seed=seed + i)
+        archivos.append((f"Detalle_liquidacion_{i + 1:02d}.xlsx", write_xlsx_bytes(df)))
+    return archivos
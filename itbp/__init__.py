@@ -0,0 +1 @@
+"""Componentes del Generador de Plantillas ITBP usados por la app de Streamlit."""
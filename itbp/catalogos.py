@@ -0,0 +1,163 @@
+"""Carga y caché de los catálogos ITBP / Transaction Type / Procesadora."""
+import hashlib
+import io
+import os
+import pickle
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import requests
+
+from itbp.disco import private_directory
+
+HOJAS_CATALOGO = {'itbp': 'ITBP', 'txn': 'Transaction Type', 'procesadora': 'Procesadora'}
+
+
+def parse_catalog_workbook(contenido):
+    """Lee las tres hojas del catálogo en una sola pasada sobre el libro."""
+    hojas = pd.read_excel(io.BytesIO(contenido), sheet_name=list(HOJAS_CATALOGO.values()), engine='openpyxl')
+    catalogs = {clave: hojas[hoja] for clave, hoja in HOJAS_CATALOGO.items()}
+    if 'Pais' in catalogs['procesadora'].columns:
+        catalogs['procesadora'].rename(columns={'Pais': 'País'}, inplace=True)
+    return catalogs
+
+
+def build_catalog_indexes(catalogs):
+    """Agrega los índices merchant_id→ITBP y país→Procesadora al diccionario de catálogos."""
+    catalogs['itbp_por_merchant'] = pd.Index(catalogs['itbp']['merchant_id'])
+    procesadora_por_pais = {}
+    for _, fila in catalogs['procesadora'].iterrows():
+        # Igual que el filtro original: gana la primera fila de cada país
+        if isinstance(fila['País'], str):
+            procesadora_por_pais.setdefault(fila['País'].upper(), fila)
+    catalogs['procesadora_por_pais'] = procesadora_por_pais
+    return catalogs
+
+
+def merge_itbp(df, catalogs):
+    """Equivale a pd.merge(df, itbp, on='merchant_id', how='inner') usando el índice precalculado."""
+    itbp = catalogs['itbp']
+    indice = catalogs.get('itbp_por_merchant')
+    columnas_itbp = itbp.columns.drop('merchant_id')
+    merchant_ids = df['merchant_id']
+    categorico = isinstance(merchant_ids.dtype, pd.CategoricalDtype)
+    tipo_valores = merchant_ids.cat.categories.dtype if categorico else merchant_ids.dtype
+    if (indice is None or not indice.is_unique or tipo_valores != indice.dtype
+            or len(columnas_itbp.intersection(df.columns)) > 0):
+        return pd.merge(df, itbp, on='merchant_id', how='inner')
+    if categorico:
+        # Se busca cada merchant distinto una sola vez y se reparte por los códigos (el -1 de los nulos va al final)
+        posiciones_categoria = np.append(indice.get_indexer(merchant_ids.cat.categories), indice.get_indexer([np.nan]))
+        posiciones = posiciones_categoria[merchant_ids.cat.codes.to_numpy()]
+    else:
+        posiciones = indice.get_indexer(merchant_ids)
+    encontrados = posiciones >= 0
+    izquierda = df[encontrados].reset_index(drop=True)
+    derecha = itbp[columnas_itbp].take(posiciones[encontrados]).reset_index(drop=True)
+    return pd.concat([izquierda, derecha], axis=1)
+
+
+class CatalogStore:
+    """Caché de catálogos compartida entre sesiones.
+
+    Mientras la copia tenga menos de `ttl_segundos` se sirve sin tocar la red.
+    Al vencer se revalida con ETag/Last-Modified y, si el servidor no los
+    respeta, con el hash del contenido, de modo que solo se vuelve a parsear
+    cuando el libro cambió. La última versión válida queda en disco (pickle
+    con los índices ya construidos) para arrancar en caliente o trabajar sin
+    conexión; los snapshots sin uso por más de `retencion_segundos` se borran.
+    Si la revalidación falla (sin red, o la descarga no es un libro válido)
+    se sirve esa copia y no se vuelve a intentar por `reintento_segundos`,
+    para que las demás llamadas no esperen el timeout detrás del candado.
+    `directorio` debe ser privado del usuario del servidor (ver
+    private_directory).
+    """
+
+    def __init__(self, directorio, ttl_segundos=15 * 60, retencion_segundos=30 * 24 * 3600, timeout=15, reintento_segundos=60):
+        self.directorio = directorio
+        self.ttl_segundos = ttl_segundos
+        self.retencion_segundos = retencion_segundos
+        self.timeout = timeout
+        self.reintento_segundos = reintento_segundos
+        self._entradas = {}
+        # url → momento a partir del cual se vuelve a intentar la revalidación fallida
+        self._reintentos = {}
+        self._lock = threading.Lock()
+        private_directory(directorio)
+
+    def get(self, url):
+        """Devuelve (catalogs, origen); origen es 'cache', 'revalidado', 'descarga' o 'sin_conexion'."""
+        with self._lock:
+            entrada = self._entradas.get(url) or self._read_snapshot(url)
+            if entrada and time.time() - entrada['verificado'] < self.ttl_segundos:
+                self._entradas[url] = entrada
+                return entrada['catalogs'], 'cache'
+            if entrada and time.time() < self._reintentos.get(url, 0):
+                return entrada['catalogs'], 'sin_conexion'
+            try:
+                entrada, origen = self._revalidate(url, entrada)
+            except Exception:
+                # Sin red o con una respuesta que no es el libro (página de login, descarga cortada):
+                # se trabaja con la última copia buena
+                if entrada is None:
+                    raise
+                self._entradas[url] = entrada
+                self._reintentos[url] = time.time() + self.reintento_segundos
+                return entrada['catalogs'], 'sin_conexion'
+            self._reintentos.pop(url, None)
+            self._entradas[url] = entrada
+            self._write_snapshot(url, entrada)
+            self._evict_snapshots()
+            return entrada['catalogs'], origen
+
+    def _revalidate(self, url, entrada):
+        cabeceras = {}
+        if entrada and entrada.get('etag'):
+            cabeceras['If-None-Match'] = entrada['etag']
+        if entrada and entrada.get('last_modified'):
+            cabeceras['If-Modified-Since'] = entrada['last_modified']
+        response = requests.get(url, headers=cabeceras, timeout=self.timeout)
+        if response.status_code == 304 and entrada:
+            return dict(entrada, verificado=time.time()), 'revalidado'
+        response.raise_for_status()
+        version = hashlib.sha256(response.content).hexdigest()
+        if entrada and entrada['catalogs'].get('version') == version:
+            catalogs, origen = entrada['catalogs'], 'revalidado'
+        else:
+            catalogs, origen = build_catalog_indexes(parse_catalog_workbook(response.content)), 'descarga'
+            catalogs['version'] = version
+        return {
+            'catalogs': catalogs,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'verificado': time.time(),
+        }, origen
+
+    def _snapshot_path(self, url):
+        return os.path.join(self.directorio, hashlib.sha256(url.encode('utf-8')).hexdigest()[:16] + '.pkl')
+
+    def _read_snapshot(self, url):
+        try:
+            with open(self._snapshot_path(url), 'rb') as f:
+                return pickle.load(f)
+        except Exception:
+            return None
+
+    def _write_snapshot(self, url, entrada):
+        ruta = self._snapshot_path(url)
+        temporal = f"{ruta}.{os.getpid()}.tmp"
+        with open(temporal, 'wb') as f:
+            pickle.dump(entrada, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporal, ruta)
+
+    def _evict_snapshots(self):
+        limite = time.time() - self.retencion_segundos
+        for nombre in os.listdir(self.directorio):
+            ruta = os.path.join(self.directorio, nombre)
+            try:
+                if os.path.getmtime(ruta) < limite:
+                    os.remove(ruta)
+            except OSError:
+                pass
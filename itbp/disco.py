@@ -0,0 +1,17 @@
+"""Directorios de las cachés en disco."""
+import os
+
+
+def private_directory(ruta):
+    """Crea `ruta` (y sus padres) con permisos 0o700 y verifica que pertenezca al usuario actual.
+
+    Las cachés guardan pickles, que ejecutan código al cargarse: un
+    directorio creado o modificable por otro usuario no se acepta.
+    """
+    os.makedirs(ruta, mode=0o700, exist_ok=True)
+    if hasattr(os, 'getuid'):
+        if os.stat(ruta).st_uid != os.getuid():
+            raise PermissionError(f"El directorio de caché {ruta} pertenece a otro usuario")
+        # makedirs no cambia los permisos de un directorio que ya existía
+        os.chmod(ruta, 0o700)
+    return ruta
@@ -0,0 +1,136 @@
+"""Escritura de las plantillas a XLSX y empaquetado en ZIP."""
+import datetime
+import hashlib
+import io
+import math
+import threading
+import zipfile
+from collections import OrderedDict
+
+import pandas as pd
+import xlsxwriter
+
+from itbp.instrumentacion import StageRecorder
+
+# Mismo estilo de encabezado que aplica pandas con df.to_excel
+FORMATO_ENCABEZADO = {'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'}
+FORMATO_FECHA_HORA = 'yyyy-mm-dd hh:mm:ss'
+FORMATO_FECHA = 'yyyy-mm-dd'
+FILAS_POR_BLOQUE = 10_000
+
+
+def to_excel_buffer(df):
+    """Convierte un DataFrame a un buffer de Excel en memoria."""
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        df.to_excel(writer, index=False, sheet_name='Sheet1')
+    return output.getvalue()
+
+
+def write_xlsx_bytes(df):
+    """Equivalente rápido de to_excel_buffer: escribe fila por fila con xlsxwriter en modo constant_memory."""
+    output = io.BytesIO()
+    workbook = xlsxwriter.Workbook(output, {'constant_memory': True, 'strings_to_urls': False})
+    worksheet = workbook.add_worksheet('Sheet1')
+    formato_encabezado = workbook.add_format(FORMATO_ENCABEZADO)
+    formato_fecha_hora = workbook.add_format({'num_format': FORMATO_FECHA_HORA})
+    formato_fecha = workbook.add_format({'num_format': FORMATO_FECHA})
+    for col, nombre in enumerate(df.columns):
+        worksheet.write(0, col, nombre, formato_encabezado)
+    for inicio in range(0, len(df), FILAS_POR_BLOQUE):
+        bloque = df.iloc[inicio:inicio + FILAS_POR_BLOQUE]
+        valores = bloque.to_numpy(dtype=object)
+        vacios = bloque.isna().to_numpy()
+        for i, (fila, fila_vacios) in enumerate(zip(valores, vacios), start=inicio + 1):
+            for col, valor in enumerate(fila):
+                # Nulos y cadenas vacías quedan como celdas en blanco, igual que con to_excel
+                if fila_vacios[col] or valor == '':
+                    continue
+                if isinstance(valor, float) and not math.isfinite(valor):
+                    # xlsxwriter no acepta ±inf como número; openpyxl los escribe como texto
+                    worksheet.write_string(i, col, str(valor))
+                elif isinstance(valor, str) and valor.startswith('='):
+                    # openpyxl también lo escribe como fórmula, pero sin resultado calculado
+                    worksheet.write_formula(i, col, valor, None, '')
+                elif isinstance(valor, datetime.datetime):
+                    worksheet.write_datetime(i, col, valor, formato_fecha_hora)
+                elif isinstance(valor, datetime.date):
+                    worksheet.write_datetime(i, col, valor, formato_fecha)
+                else:
+                    worksheet.write(i, col, valor)
+    workbook.close()
+    return output.getvalue()
+
+
+def _measured_write_xlsx(nombre_archivo, df, registro):
+    with registro.stage('xlsx', nombre_archivo, filas_entrada=len(df)) as medicion:
+        excel_buffer = write_xlsx_bytes(df)
+        medicion['filas_salida'] = len(df)
+    return excel_buffer
+
+
+def _write_xlsx_task(nombre_archivo, df):
+    registro = StageRecorder(emitir=False)
+    excel_buffer = _measured_write_xlsx(nombre_archivo, df, registro)
+    return nombre_archivo, excel_buffer, registro.mediciones
+
+
+def create_zip_buffer(archivos_generados, pool=None, registro=None):
+    """Toma una lista de (nombre_archivo, dataframe) y crea un archivo ZIP en memoria.
+
+    Con un `pool` de process_pool los libros se escriben en sus procesos; cada uno se
+    agrega al ZIP apenas está listo, respetando el orden de la lista. Cada
+    libro se registra como etapa 'xlsx' y el empaquetado completo como 'zip'.
+    """
+    registro = registro if registro is not None else StageRecorder(emitir=False)
+    zip_buffer = io.BytesIO()
+    filas = sum(len(df) for _, df in archivos_generados)
+    with registro.stage('zip', f"{len(archivos_generados)} archivos", filas_entrada=filas) as medicion:
+        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+            if pool is not None and len(archivos_generados) > 1:
+                nombres, frames = zip(*archivos_generados)
+                for nombre_archivo, excel_buffer, mediciones in pool.map(_write_xlsx_task, nombres, frames):
+                    registro.extend(mediciones)
+                    zip_file.writestr(nombre_archivo, excel_buffer)
+            else:
+                for nombre_archivo, df in archivos_generados:
+                    zip_file.writestr(nombre_archivo, _measured_write_xlsx(nombre_archivo, df, registro))
+        medicion['filas_salida'] = filas
+    return zip_buffer.getvalue()
+
+
+def input_key(contenidos, version_catalogo):
+    """Huella de una ejecución: contenido de cada archivo subido (en orden) más la versión del catálogo."""
+    huella = hashlib.sha256(str(version_catalogo).encode('utf-8'))
+    for contenido in contenidos:
+        huella.update(hashlib.sha256(contenido).digest())
+    return huella.hexdigest()
+
+
+class ArchiveCache:
+    """ZIPs ya generados, indexados por input_key y con límite de memoria (se descarta el menos usado)."""
+
+    def __init__(self, max_bytes=512 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._archivos = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, clave):
+        with self._lock:
+            archivo = self._archivos.get(clave)
+            if archivo is not None:
+                self._archivos.move_to_end(clave)
+            return archivo
+
+    def put(self, clave, archivo):
+        """Guarda un dict con al menos la llave 'datos' (bytes del ZIP)."""
+        with self._lock:
+            anterior = self._archivos.pop(clave, None)
+            if anterior is not None:
+                self._total_bytes -= len(anterior['datos'])
+            self._archivos[clave] = archivo
+            self._total_bytes += len(archivo['datos'])
+            while self._total_bytes > self.max_bytes and len(self._archivos) > 1:
+                _, descartado = self._archivos.popitem(last=False)
+                self._total_bytes -= len(descartado['datos'])
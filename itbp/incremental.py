@@ -0,0 +1,149 @@
+"""Reprocesamiento incremental: totales parciales por archivo, guardados en disco."""
+import hashlib
+import os
+import pickle
+import tempfile
+
+import pandas as pd
+
+from itbp.ingesta import read_detail, required_detail_columns
+from itbp.disco import private_directory
+from itbp.instrumentacion import StageRecorder
+from itbp.motor import CLAVES_PARTICION, aggregate_partitions, list_partitions, merge_partial_totals, prepare_detail
+from itbp.paralelo import worker_catalogs
+
+# Subir este número cuando cambie el contenido de los parciales, para invalidar los ya guardados
+VERSION_PARCIAL = 2
+
+
+def partial_key(contenido, version_catalogo):
+    """Clave de un parcial: contenido del archivo, versión del catálogo y formato del parcial."""
+    huella = hashlib.sha256(f"{VERSION_PARCIAL}:{version_catalogo}:".encode('utf-8'))
+    huella.update(contenido)
+    return huella.hexdigest()
+
+
+def build_partial(contenido, columnas, catalogs, registro=None, nombre=''):
+    """Lee un Detalle_liquidación y devuelve sus totales por partición y el orden de sus particiones.
+
+    Con un StageRecorder en `registro` se miden la lectura, los ajustes de
+    Chile/MID y la totalización del archivo `nombre`.
+    """
+    registro = registro if registro is not None else StageRecorder(emitir=False)
+    with registro.stage('lectura', nombre) as medicion:
+        df_detalle = read_detail(contenido, columnas)
+        medicion['filas_salida'] = filas = len(df_detalle)
+    with registro.stage('ajustes', nombre, filas_entrada=filas) as medicion:
+        df_detalle = prepare_detail(df_detalle)
+        medicion['filas_salida'] = len(df_detalle)
+    with registro.stage('totalizacion', nombre, filas_entrada=len(df_detalle)) as medicion:
+        totales = aggregate_partitions(df_detalle, catalogs)
+        medicion['filas_salida'] = len(totales)
+    return {
+        'totales': totales,
+        'particiones': df_detalle[CLAVES_PARTICION].drop_duplicates().reset_index(drop=True),
+        'filas': filas,
+        # Sin país o sin createddate la fila no cae en ninguna partición ni en ninguna plantilla
+        'sin_particion': int(df_detalle[CLAVES_PARTICION].isna().any(axis=1).sum()),
+    }
+
+
+class PartialAggregateCache:
+    """Parciales en disco (pickle) con tope de tamaño; al superarlo se borran los de uso más antiguo.
+
+    `directorio` debe ser privado del usuario del servidor (ver private_directory).
+    """
+
+    def __init__(self, directorio, max_bytes=2 * 1024 ** 3):
+        self.directorio = directorio
+        self.max_bytes = max_bytes
+        private_directory(directorio)
+
+    def _path(self, clave):
+        return os.path.join(self.directorio, f"{clave}.pkl")
+
+    def get(self, clave):
+        ruta = self._path(clave)
+        try:
+            with open(ruta, 'rb') as f:
+                parcial = pickle.load(f)
+            # La fecha de modificación marca el último uso para el descarte LRU
+            os.utime(ruta)
+            return parcial
+        except Exception:
+            return None
+
+    def put(self, clave, parcial):
+        # Nombre temporal único: dos trabajos del mismo proceso pueden guardar el mismo parcial a la vez
+        descriptor, temporal = tempfile.mkstemp(dir=self.directorio, suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as f:
+                pickle.dump(parcial, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporal, self._path(clave))
+        except BaseException:
+            os.remove(temporal)
+            raise
+        self._evict()
+
+    def _evict(self):
+        archivos = []
+        for nombre in os.listdir(self.directorio):
+            if nombre.endswith('.pkl'):
+                ruta = os.path.join(self.directorio, nombre)
+                try:
+                    estado = os.stat(ruta)
+                except OSError:
+                    continue
+                archivos.append((estado.st_mtime, estado.st_size, ruta))
+        total = sum(tamano for _, tamano, _ in archivos)
+        for _, tamano, ruta in sorted(archivos):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(ruta)
+                total -= tamano
+            except OSError:
+                pass
+
+
+def _build_partial_task(contenido, columnas, nombre):
+    registro = StageRecorder(emitir=False)
+    parcial = build_partial(contenido, columnas, worker_catalogs(), registro, nombre)
+    return parcial, registro.mediciones
+
+
+def aggregate_uploads(archivos, catalogs, cache=None, pool=None, registro=None):
+    """Totaliza una lista de (nombre, bytes) reutilizando los parciales ya calculados.
+
+    Solo se leen y totalizan los archivos nuevos o modificados (en paralelo si
+    se pasa un `pool` de process_pool creado con estos `catalogs`). Devuelve los totales combinados, la lista de
+    particiones en orden y un resumen por archivo, que incluye las filas que
+    quedaron fuera de toda partición ('sin_particion'). Las etapas de cada archivo
+    procesado y la combinación de los parciales se registran en `registro`.
+    """
+    registro = registro if registro is not None else StageRecorder(emitir=False)
+    columnas = required_detail_columns(catalogs)
+    claves = [partial_key(contenido, catalogs.get('version')) for _, contenido in archivos]
+    parciales = [cache.get(clave) if cache else None for clave in claves]
+    pendientes = [i for i, parcial in enumerate(parciales) if parcial is None]
+    if pool is not None and len(pendientes) > 1:
+        futuros = {i: pool.submit(_build_partial_task, archivos[i][1], columnas, archivos[i][0]) for i in pendientes}
+        for i, futuro in futuros.items():
+            parciales[i], mediciones = futuro.result()
+            registro.extend(mediciones)
+    else:
+        for i in pendientes:
+            parciales[i] = build_partial(archivos[i][1], columnas, catalogs, registro, archivos[i][0])
+    if cache:
+        for i in pendientes:
+            cache.put(claves[i], parciales[i])
+
+    resumen = [
+        {'archivo': nombre, 'filas': parcial['filas'], 'sin_particion': parcial['sin_particion'], 'bytes': len(contenido), 'reutilizado': i not in pendientes}
+        for i, ((nombre, contenido), parcial) in enumerate(zip(archivos, parciales))
+    ]
+    with registro.stage('consolidacion', filas_entrada=sum(len(parcial['totales']) for parcial in parciales)) as medicion:
+        df_totalizado = merge_partial_totals([parcial['totales'] for parcial in parciales])
+        particiones = list_partitions(pd.concat([parcial['particiones'] for parcial in parciales], ignore_index=True))
+        medicion['filas_salida'] = len(df_totalizado)
+    return df_totalizado, particiones, resumen
@@ -0,0 +1,42 @@
+"""Lectura de los archivos Detalle_liquidación subidos por el usuario."""
+import io
+
+import pandas as pd
+
+from itbp.motor import CLAVES_TOTALIZADO, COLUMNAS_MONTO
+
+# Columnas de texto que se leen como str en lugar de dejar que pandas infiera el tipo
+COLUMNAS_TEXTO = ['merchant_name', 'country', 'processor_name', 'currency_code', 'payment_method', 'transaction_type']
+# Claves muy repetitivas: como categorías la memoria crece con los valores distintos, no con las filas
+COLUMNAS_CATEGORICAS = ['merchant_id'] + COLUMNAS_TEXTO
+
+
+def required_detail_columns(catalogs):
+    """Columnas del detalle que usa el pipeline; las que aporta el catálogo ITBP no se leen del detalle."""
+    columnas = ['country', 'processor_name', 'createddate', 'fecha_pago'] + CLAVES_TOTALIZADO + COLUMNAS_MONTO
+    aportadas_por_itbp = set(catalogs['itbp'].columns) - {'merchant_id'}
+    return list(dict.fromkeys(col for col in columnas if col not in aportadas_por_itbp))
+
+
+def compact_detail(df):
+    """Convierte las claves a categorías y los montos a números nativos, sobre el mismo frame."""
+    for col in COLUMNAS_MONTO:
+        if col in df.columns and not pd.api.types.is_numeric_dtype(df[col]):
+            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
+    for col in COLUMNAS_CATEGORICAS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    return df
+
+
+def read_detail(contenido, columnas):
+    """Lee un Detalle_liquidación (bytes) conservando solo `columnas`, en formato compacto."""
+    requeridas = set(columnas)
+    df = pd.read_excel(
+        io.BytesIO(contenido),
+        engine='openpyxl',
+        usecols=lambda col: col in requeridas,
+        dtype={col: str for col in COLUMNAS_TEXTO if col in requeridas},
+    )
+    return compact_detail(df)
+
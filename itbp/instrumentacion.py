@@ -0,0 +1,125 @@
+"""Mediciones por etapa (tiempo, CPU, filas y memoria) y perfilado opcional con cProfile."""
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+from itbp.memoria import current_rss
+
+# Una línea JSON por medición; el servidor la recoge por stderr
+logger = logging.getLogger('itbp.tiempos')
+
+
+def enable_json_log(stream=None):
+    """Envía las mediciones de `logger` a `stream` (stderr por defecto); llamarla varias veces no duplica líneas."""
+    if any(getattr(handler, '_itbp_json', False) for handler in logger.handlers):
+        return
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    handler._itbp_json = True
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+class StageRecorder:
+    """Acumula una medición por etapa y por elemento (archivo, partición o libro).
+
+    Las mediciones tomadas en los procesos del pool se arman allí con un
+    StageRecorder propio (`emitir=False`) y se incorporan con `extend`, de
+    modo que cada línea JSON se emite una sola vez, desde el proceso principal.
+    """
+
+    def __init__(self, ejecucion=None, emitir=True):
+        self.ejecucion = ejecucion
+        self.emitir = emitir
+        self.mediciones = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, etapa, detalle='', filas_entrada=None):
+        """Mide el bloque `with`; el bloque puede completar 'filas_salida' o 'detalle' en el dict que recibe."""
+        medicion = {
+            'etapa': etapa,
+            'detalle': detalle,
+            'segundos': None,
+            'cpu_segundos': None,
+            'filas_entrada': filas_entrada,
+            'filas_salida': None,
+            'memoria_delta_bytes': None,
+            'pid': os.getpid(),
+        }
+        rss_inicial = current_rss()
+        inicio, inicio_cpu = time.perf_counter(), time.process_time()
+        try:
+            yield medicion
+        finally:
+            medicion['segundos'] = time.perf_counter() - inicio
+            medicion['cpu_segundos'] = time.process_time() - inicio_cpu
+            medicion['memoria_delta_bytes'] = current_rss() - rss_inicial
+            self.add(medicion)
+
+    def add(self, medicion):
+        with self._lock:
+            self.mediciones.append(medicion)
+        if self.emitir:
+            logger.info(json.dumps({'evento': 'etapa', 'ejecucion': self.ejecucion, **medicion}, ensure_ascii=False, default=str))
+
+    def extend(self, mediciones):
+        for medicion in mediciones:
+            self.add(medicion)
+
+    def to_frame(self):
+        """Una fila por medición, en el orden en que se registraron."""
+        return pd.DataFrame(self.mediciones, columns=['etapa', 'detalle', 'segundos', 'cpu_segundos', 'filas_entrada', 'filas_salida', 'memoria_delta_bytes', 'pid'])
+
+    def summary(self):
+        """Totales por etapa, de la más lenta a la más rápida."""
+        df = self.to_frame()
+        resumen = df.groupby('etapa', sort=False).agg(
+            mediciones=('segundos', 'size'),
+            segundos=('segundos', 'sum'),
+            cpu_segundos=('cpu_segundos', 'sum'),
+            maximo_segundos=('segundos', 'max'),
+            memoria_delta_bytes=('memoria_delta_bytes', 'sum'),
+        ).reset_index()
+        return resumen.sort_values('segundos', ascending=False, kind='stable').reset_index(drop=True)
+
+
+@contextmanager
+def profiled(activo=True):
+    """Perfila el bloque con cProfile si `activo`; entrega el Profile (o None). Solo cubre el proceso actual."""
+    if not activo:
+        yield None
+        return
+    perfil = cProfile.Profile()
+    perfil.enable()
+    try:
+        yield perfil
+    finally:
+        perfil.disable()
+
+
+def profile_dump(*perfiles):
+    """Bytes de los perfiles, combinados, en formato pstats, para abrirlos luego con pstats o snakeviz."""
+    with tempfile.TemporaryDirectory() as directorio:
+        ruta = os.path.join(directorio, 'perfil.prof')
+        pstats.Stats(*perfiles).dump_stats(ruta)
+        with open(ruta, 'rb') as f:
+            return f.read()
+
+
+def profile_summary(*perfiles, limite=30):
+    """Las `limite` funciones con más tiempo acumulado en los perfiles combinados, como texto."""
+    salida = io.StringIO()
+    pstats.Stats(*perfiles, stream=salida).sort_stats('cumulative').print_stats(limite)
+    return salida.getvalue()
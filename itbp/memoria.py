@@ -0,0 +1,81 @@
+"""Medición de memoria residente (RSS) del proceso."""
+import os
+import sys
+import threading
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def current_rss():
+    """RSS actual en bytes; fuera de Linux se usa el máximo histórico del proceso como aproximación."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    if resource is None:
+        return 0
+    maximo = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss viene en bytes en macOS y en KiB en el resto
+    return maximo if sys.platform == 'darwin' else maximo * 1024
+
+
+def children_rss():
+    """Suma del RSS de los procesos hijos directos (p. ej. los del pool); 0 si /proc no existe."""
+    padre = str(os.getpid())
+    total = 0
+    try:
+        entradas = os.listdir('/proc')
+    except OSError:
+        return 0
+    for entrada in entradas:
+        if not entrada.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entrada}/stat') as f:
+                # Campos después del nombre del proceso: estado, ppid, ..., rss (en páginas) en la posición 21
+                campos = f.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        if campos[1] == padre:
+            total += int(campos[21]) * os.sysconf('SC_PAGE_SIZE')
+    return total
+
+
+class PeakMemoryMonitor:
+    """Muestrea el RSS en un hilo mientras dura el bloque `with` y guarda el pico en `pico_bytes`.
+
+    Con `incluir_hijos` el pico considera también a los procesos del pool,
+    que es lo que cuenta para el límite de memoria del contenedor.
+    """
+
+    def __init__(self, intervalo_segundos=0.05, incluir_hijos=True):
+        self.intervalo_segundos = intervalo_segundos
+        self.incluir_hijos = incluir_hijos
+        self.inicial_bytes = 0
+        self.pico_bytes = 0
+        self._detener = threading.Event()
+        self._hilo = None
+
+    def __enter__(self):
+        self.inicial_bytes = self.pico_bytes = self._rss()
+        self._detener.clear()
+        self._hilo = threading.Thread(target=self._sample, daemon=True)
+        self._hilo.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._detener.set()
+        self._hilo.join()
+        self.pico_bytes = max(self.pico_bytes, self._rss())
+        return False
+
+    def _rss(self):
+        return current_rss() + (children_rss() if self.incluir_hijos else 0)
+
+    def _sample(self):
+        while not self._detener.wait(self.intervalo_segundos):
+            self.pico_bytes = max(self.pico_bytes, self._rss())
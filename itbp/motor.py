@@ -0,0 +1,138 @@
+"""Motor de procesamiento: agrupa el detalle consolidado y arma las plantillas por partición."""
+import numpy as np
+import pandas as pd
+
+from itbp.catalogos import merge_itbp
+from itbp.instrumentacion import StageRecorder
+from itbp.paralelo import worker_catalogs
+from itbp.plantillas import build_templates
+
+COLUMNAS_MONTO = ['approved_transaction_amount','kushki_commission','iva_kushki_commission']
+CLAVES_TOTALIZADO = ['fecha_pago','createddate','merchant_id','merchant_name','currency_code','RUC_Contable_ITBP','PostingGroup2_proveedor','VAT Registration Type KCP Revenue','VAT Registration No.Revenue','TipoMovimientoCXP','DIM2','DIM3','DIM4','payment_method','transaction_type','TipoMovimientoIng','CuentaIng','CuentaIva','processor_name']
+COLUMNAS_TOTAL = ['total_approved_amount', 'total_kushki_commission', 'total_iva_kushki_commission']
+# Cada archivo de salida corresponde a un país y a una fecha de grupo semanal
+CLAVES_PARTICION = ['country', 'output_group']
+# MID que solo se conserva cuando lo procesa Kushki Acquirer Processor
+MID_DESCARTE = '20000000107065050000'
+
+
+def get_output_group_dates(fechas):
+    """Fecha de grupo de cada fecha: viernes, sábado y domingo se agrupan en el domingo."""
+    dias = fechas.dt.weekday
+    return fechas.dt.normalize() + pd.to_timedelta((6 - dias).where(dias >= 4, 0), unit='D')
+
+
+def list_partitions(df):
+    """Lista (país, grupo) en el mismo orden que el recorrido país → grupo sobre valores únicos."""
+    pares = df[CLAVES_PARTICION].drop_duplicates().dropna()
+    orden_pais = pd.factorize(pares['country'])[0]
+    pares = pares.iloc[np.argsort(orden_pais, kind='stable')]
+    return list(pares.itertuples(index=False, name=None))
+
+
+def prepare_detail(df_detalle):
+    """Aplica los ajustes de negocio al detalle leído y calcula la fecha de grupo de cada fila.
+
+    Modifica `df_detalle` en lugar de copiarlo; devuelve el frame resultante.
+    """
+    # Con columnas categóricas el strip/upper se calcula una vez por valor distinto
+    procesador = df_detalle['processor_name'].str.strip().str.upper()
+    # Lógica de negocio (ajuste para Chile)
+    condicion_kushki = (df_detalle['country'].str.strip().str.upper() == 'CHILE') & (procesador == 'KUSHKI ACQUIRER PROCESSOR')
+    if condicion_kushki.any():
+        if isinstance(df_detalle['country'].dtype, pd.CategoricalDtype) and 'Chile Operadora' not in df_detalle['country'].cat.categories:
+            df_detalle['country'] = df_detalle['country'].cat.add_categories('Chile Operadora')
+        df_detalle.loc[condicion_kushki, 'country'] = 'Chile Operadora'
+    condicion_descarte_mid = (df_detalle['merchant_id'] == MID_DESCARTE) & (procesador != 'KUSHKI ACQUIRER PROCESSOR')
+    if condicion_descarte_mid.any():
+        df_detalle = df_detalle.drop(index=df_detalle.index[condicion_descarte_mid.to_numpy()])
+    df_detalle['createddate'] = pd.to_datetime(df_detalle['createddate'])
+    df_detalle['fecha_pago'] = pd.to_datetime(df_detalle['fecha_pago'], errors='coerce')
+    df_detalle['output_group'] = get_output_group_dates(df_detalle['createddate'])
+    return df_detalle
+
+
+def aggregate_totals(df, catalogs, claves_extra=()):
+    """Cruza con el catálogo ITBP y totaliza los montos por las claves de la plantilla."""
+    df_filtrado = merge_itbp(df, catalogs)
+    for col in COLUMNAS_MONTO:
+        if col in df_filtrado.columns and not pd.api.types.is_numeric_dtype(df_filtrado[col]):
+            df_filtrado[col] = pd.to_numeric(df_filtrado[col], errors='coerce').fillna(0)
+    df_totalizado = df_filtrado.groupby(list(claves_extra) + CLAVES_TOTALIZADO, dropna=False, observed=True).agg(total_approved_amount=pd.NamedAgg(column='approved_transaction_amount', aggfunc='sum'),total_kushki_commission=pd.NamedAgg(column='kushki_commission', aggfunc='sum'),total_iva_kushki_commission=pd.NamedAgg(column='iva_kushki_commission', aggfunc='sum')).reset_index()
+    # Las plantillas trabajan con los valores originales, no con categorías
+    for col in df_totalizado.columns:
+        if isinstance(df_totalizado[col].dtype, pd.CategoricalDtype):
+            df_totalizado[col] = df_totalizado[col].astype(df_totalizado[col].cat.categories.dtype)
+    return df_totalizado
+
+
+def aggregate_partitions(df_detalle, catalogs):
+    """Totaliza todas las particiones juntas, descartando los países sin cuentas en Procesadora."""
+    paises = df_detalle['country'].dropna().unique()
+    paises_con_cuentas = [pais for pais in paises if pais.upper() in catalogs['procesadora_por_pais']]
+    if len(paises_con_cuentas) < len(paises) or df_detalle['country'].hasnans:
+        df_detalle = df_detalle[df_detalle['country'].isin(paises_con_cuentas)]
+    return aggregate_totals(df_detalle, catalogs, claves_extra=CLAVES_PARTICION)
+
+
+def merge_partial_totals(lista_totales):
+    """Combina totales parciales (p. ej. uno por archivo) sumando los montos de claves repetidas."""
+    if len(lista_totales) == 1:
+        return lista_totales[0]
+    df_totales = pd.concat(lista_totales, ignore_index=True)
+    return df_totales.groupby(CLAVES_PARTICION + CLAVES_TOTALIZADO, dropna=False)[COLUMNAS_TOTAL].sum().reset_index()
+
+
+def _measured_build_templates(df_totalizado, pais_actual, grupo_fecha, catalogs, registro):
+    with registro.stage('plantillas', f"{pais_actual} {grupo_fecha.strftime('%Y-%m-%d')}", filas_entrada=len(df_totalizado)) as medicion:
+        resultado_procesado, resultado_revenue = build_templates(df_totalizado, pais_actual, grupo_fecha, catalogs)
+        if resultado_procesado:
+            medicion['filas_salida'] = len(resultado_procesado[1]) + len(resultado_revenue[1])
+    return resultado_procesado, resultado_revenue
+
+
+def _build_templates_task(df_totalizado, pais_actual, grupo_fecha):
+    registro = StageRecorder(emitir=False)
+    resultados = _measured_build_templates(df_totalizado, pais_actual, grupo_fecha, worker_catalogs(), registro)
+    return resultados, registro.mediciones
+
+
+def iter_templates(df_totalizado, particiones, catalogs, pool=None, registro=None):
+    """Arma las plantillas de cada partición a partir de los totales de aggregate_partitions.
+
+    Produce tuplas (país, grupo, resultado_procesado, resultado_revenue) en el
+    orden de `particiones`; los países sin cuentas en Procesadora llegan con
+    (None, None). Con un `pool` de process_pool creado con estos `catalogs`
+    las plantillas se arman en sus procesos y los resultados se entregan a
+    medida que terminan, sin alterar ese orden. Si se pasa un StageRecorder en `registro`, cada partición
+    queda registrada como etapa 'plantillas'.
+    """
+    registro = registro if registro is not None else StageRecorder(emitir=False)
+    con_cuentas = [pais.upper() in catalogs['procesadora_por_pais'] for pais, _ in particiones]
+    posiciones = df_totalizado.groupby(CLAVES_PARTICION, sort=False).indices
+    df_vacio = df_totalizado.iloc[:0].drop(columns=CLAVES_PARTICION)
+
+    def totales_particion(pais, grupo):
+        filas = posiciones.get((pais, grupo))
+        if filas is None:
+            return df_vacio.copy()
+        return df_totalizado.take(filas).drop(columns=CLAVES_PARTICION).reset_index(drop=True)
+
+    if pool is not None and sum(con_cuentas) > 1:
+        futuros = [
+            pool.submit(_build_templates_task, totales_particion(pais, grupo), pais, grupo) if valido else None
+            for (pais, grupo), valido in zip(particiones, con_cuentas)
+        ]
+        for (pais, grupo), futuro in zip(particiones, futuros):
+            resultado_procesado, resultado_revenue = None, None
+            if futuro:
+                (resultado_procesado, resultado_revenue), mediciones = futuro.result()
+                registro.extend(mediciones)
+            yield pais, grupo, resultado_procesado, resultado_revenue
+    else:
+        for (pais, grupo), valido in zip(particiones, con_cuentas):
+            if valido:
+                resultado_procesado, resultado_revenue = _measured_build_templates(totales_particion(pais, grupo), pais, grupo, catalogs, registro)
+            else:
+                resultado_procesado, resultado_revenue = None, None
+            yield pais, grupo, resultado_procesado, resultado_revenue
@@ -0,0 +1,91 @@
+"""Pool de procesos que un trabajo crea una sola vez y comparten todas sus etapas."""
+import multiprocessing.context
+import os
+import sys
+import threading
+import types
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, nullcontext
+
+# Iniciar un proceso (spawn + importar pandas) cuesta más de un segundo: con entradas
+# más chicas que esto el trabajo termina antes en un solo proceso
+MIN_BYTES_PARALELO = 5 * 1024 ** 2
+
+
+def default_workers():
+    """Cantidad de procesos a usar; se puede fijar con la variable ITBP_MAX_WORKERS."""
+    return int(os.environ.get("ITBP_MAX_WORKERS", 0)) or os.cpu_count() or 1
+
+
+# Catálogos de cada proceso del pool: se envían una sola vez al iniciar el proceso
+_catalogs_worker = None
+
+
+def _init_worker(catalogs):
+    global _catalogs_worker
+    _catalogs_worker = catalogs
+
+
+def worker_catalogs():
+    """Catálogos recibidos por el proceso actual al iniciarse (None fuera del pool)."""
+    return _catalogs_worker
+
+
+# __main__ que ven los procesos al iniciarse: sin __file__ ni __spec__, no vuelven a ejecutar ningún script
+_MAIN_WORKER = types.ModuleType('__main__')
+_lock_main = threading.Lock()
+
+
+@contextmanager
+def _main_sin_script():
+    """Reemplaza __main__ mientras se lanza un proceso.
+
+    Streamlit instala como __main__ un módulo con el __file__ de la app; con
+    'spawn' cada proceso volvería a ejecutar la app completa antes de
+    recibir su primera tarea.
+    """
+    with _lock_main:
+        main = sys.modules['__main__']
+        sys.modules['__main__'] = _MAIN_WORKER
+        try:
+            yield
+        finally:
+            # Si mientras tanto un rerun de Streamlit instaló otro __main__, se respeta ese
+            if sys.modules['__main__'] is _MAIN_WORKER:
+                sys.modules['__main__'] = main
+
+
+class _SpawnProcess(multiprocessing.context.SpawnProcess):
+    @staticmethod
+    def _Popen(process_obj):
+        with _main_sin_script():
+            return multiprocessing.context.SpawnProcess._Popen(process_obj)
+
+
+class _SpawnContext(multiprocessing.context.SpawnContext):
+    Process = _SpawnProcess
+
+
+def process_pool(max_workers, catalogs=None):
+    """Pool de procesos cuyos procesos reciben `catalogs` al iniciar; las tareas los leen con worker_catalogs().
+
+    Los procesos no cargan el script principal, así que las tareas deben ser
+    funciones de módulos importables (itbp.*).
+    """
+    # 'spawn' evita heredar los hilos del servidor de Streamlit al crear los procesos
+    return ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=_SpawnContext(),
+        initializer=_init_worker,
+        initargs=(catalogs,),
+    )
+
+
+def job_pool(max_workers, catalogs=None):
+    """process_pool si `max_workers` > 1; si no, un contexto que entrega None y todo corre en el proceso actual.
+
+    Los procesos se crean a medida que llegan tareas, así que un pool sin uso no cuesta nada.
+    """
+    if max_workers > 1:
+        return process_pool(max_workers, catalogs)
+    return nullcontext()
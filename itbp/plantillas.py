@@ -0,0 +1,199 @@
+"""Especificación declarativa de las plantillas Procesado / Revenue y su armado vectorizado."""
+import numpy as np
+import pandas as pd
+
+# Procesado y Revenue comparten el mismo diseño de columnas
+COLUMNAS_PROCESADO = ['Tipo mov.','Nº cuenta','Fecha registro','Tipo documento','Nº documento','Descripción','Importe','Importe debe','Importe haber','Cód. términos pago','Tipo de registro gen.','Nº documento externo','PostingGroup2','Prepayment','Tipo contrapartida','Cta. Contrapartida','DIM 1','DIM 2','DIM 3','DIM 4','DIM 5','DIM 6','DIM 7','DIM 8','VAT\xa0Registration\xa0Type\xa0KCP','VAT\xa0Registration\xa0No."','Cód. divisa']
+COLUMNAS_REVENUE = COLUMNAS_PROCESADO
+
+# Tipos de transacción que van al debe; el resto va al haber
+TIPOS_DEBE = ['REVERSE','CHARGEBACK','VOID','REFUND']
+
+# --- Reglas por país (clave: país en mayúsculas) ---
+# dim3_en_dim7: el DIM3 del comercio se informa en la columna DIM 7 y DIM 3 queda vacía.
+# doc_externo_contrapartida: 'Nº documento externo' de las contrapartidas de Procesado.
+# tipo_registro_revenue: 'Tipo de registro gen.' de las líneas de Revenue e IVA.
+# divisas_informadas: monedas que se escriben en 'Cód. divisa' (las demás quedan vacías).
+REGLAS_PAIS_DEFECTO = {
+    'dim3_en_dim7': False,
+    'doc_externo_contrapartida': '',
+    'tipo_registro_revenue': '',
+    'divisas_informadas': [],
+}
+REGLAS_PAIS = {
+    'CHILE': {'dim3_en_dim7': True},
+    'CHILE OPERADORA': {'dim3_en_dim7': True},
+    'PERU': {'doc_externo_contrapartida': '169922', 'tipo_registro_revenue': 'Compra', 'divisas_informadas': ['USD']},
+}
+
+# --- Líneas de cada plantilla ---
+# Cada línea es (columna de monto, {columna de salida: columna de origen}). El
+# origen es una columna de los totales cruzados con el catálogo o una de las
+# derivadas que arma _derived_columns; 'debe' y 'haber' reparten el monto de
+# la línea según el tipo de transacción.
+LINEA_PROCESADO = {
+    'Tipo mov.': 'TipoMovimientoCXP',
+    'Nº cuenta': 'RUC_Contable_ITBP',
+    'Fecha registro': 'fecha_registro',
+    'Nº documento': 'Nº documento',
+    'Descripción': 'descripcion_procesado',
+    'Importe debe': 'debe',
+    'Importe haber': 'haber',
+    'Nº documento externo': 'fecha_pago_texto',
+    'PostingGroup2': 'PostingGroup2_proveedor',
+    'DIM 2': 'DIM2',
+    'DIM 3': 'dim3',
+    'DIM 4': 'DIM4',
+    'DIM 7': 'dim7',
+    'Cód. divisa': 'divisa',
+}
+LINEA_REVENUE = {
+    'Tipo mov.': 'TipoMovimientoIng',
+    'Nº cuenta': 'CuentaIng',
+    'Fecha registro': 'fecha_registro',
+    'Nº documento': 'Nº documento',
+    'Descripción': 'descripcion_revenue',
+    'Importe debe': 'debe',
+    'Importe haber': 'haber',
+    'Tipo de registro gen.': 'tipo_registro',
+    'Nº documento externo': 'fecha_pago_texto',
+    'PostingGroup2': 'PostingGroup2_proveedor',
+    'Tipo contrapartida': 'TipoMovimientoCXP',
+    'Cta. Contrapartida': 'RUC_Contable_ITBP',
+    'DIM 2': 'DIM2',
+    'DIM 3': 'dim3',
+    'DIM 4': 'DIM4',
+    'DIM 7': 'dim7',
+    'VAT\xa0Registration\xa0Type\xa0KCP': 'VAT Registration Type KCP Revenue',
+    'VAT\xa0Registration\xa0No."': 'VAT Registration No.Revenue',
+    'Cód. divisa': 'divisa',
+}
+LINEA_IVA = dict(LINEA_REVENUE, **{'Nº cuenta': 'CuentaIva', 'Descripción': 'descripcion_iva'})
+
+LINEAS_PROCESADO = [('total_approved_amount', LINEA_PROCESADO)]
+LINEAS_REVENUE = [('total_kushki_commission', LINEA_REVENUE), ('total_iva_kushki_commission', LINEA_IVA)]
+
+# Contrapartida de Procesado: una línea por fecha, documento, transacción y divisa
+# contra la cuenta de la procesadora del país (debe y haber invertidos)
+CLAVES_CONTRAPARTIDA = ['Fecha registro', 'Nº documento', 'descripcion_txn', 'Cód. divisa']
+SUFIJO_CONTRAPARTIDA = ' KUSHKI ACQUIRER PROCESSOR'
+
+
+def country_rules(pais_actual):
+    """Reglas del país combinadas con los valores por defecto."""
+    return {**REGLAS_PAIS_DEFECTO, **REGLAS_PAIS.get(pais_actual.upper(), {})}
+
+
+def _per_day(fechas, formatear):
+    """Aplica `formatear` (Series de fechas → Series de texto) una vez por día distinto y lo reparte por fila."""
+    codigos, dias = pd.factorize(fechas.dt.normalize())
+    textos = formatear(pd.Series(dias))
+    # El código -1 (NaT) toma el NaN agregado al final
+    textos = pd.concat([textos, pd.Series([np.nan], dtype=textos.dtype)], ignore_index=True)
+    return pd.Series(textos.to_numpy()[codigos], index=fechas.index, dtype=textos.dtype)
+
+
+def _derived_columns(df_final, reglas):
+    """Columnas compartidas por todas las líneas de una partición, calculadas una sola vez."""
+    merchant = df_final['merchant_name'].fillna('')
+    if reglas['dim3_en_dim7']:
+        dim3, dim7 = '', df_final['DIM3']
+    else:
+        dim3, dim7 = df_final['DIM3'], ''
+    return {
+        'fecha_registro': _per_day(df_final['createddate'], lambda f: f.dt.strftime('%d/%m/%Y')),
+        'Nº documento': _per_day(df_final['createddate'], lambda f: 'W' + f.dt.isocalendar().week.astype(str).str.zfill(2) + '-' + f.dt.strftime('%y')),
+        'fecha_pago_texto': _per_day(df_final['fecha_pago'], lambda f: f.dt.strftime('%d/%m/%Y')),
+        'es_debe': df_final['transaction_type'].isin(TIPOS_DEBE).to_numpy(),
+        'dim3': dim3,
+        'dim7': dim7,
+        'divisa': np.where(df_final['currency_code'].isin(reglas['divisas_informadas']), df_final['currency_code'], ''),
+        'descripcion_procesado': df_final['descripcion_txn'].fillna('') + ' ' + merchant,
+        'descripcion_revenue': 'REVENUE ' + merchant,
+        'descripcion_iva': 'IVA REVENUE ' + merchant,
+        'tipo_registro': reglas['tipo_registro_revenue'],
+    }
+
+
+def _build_lines(lineas, df_final, derivadas):
+    """Arma las líneas de una plantilla; devuelve una lista de DataFrames (uno por tipo de línea)."""
+    bloques = []
+    for columna_monto, especificacion in lineas:
+        monto = df_final[columna_monto]
+        importes = {
+            'debe': np.where(derivadas['es_debe'], monto, 0),
+            'haber': np.where(~derivadas['es_debe'], monto, 0),
+        }
+        columnas = {}
+        for columna, origen in especificacion.items():
+            if origen in importes:
+                columnas[columna] = importes[origen]
+            elif origen in derivadas:
+                columnas[columna] = derivadas[origen]
+            else:
+                columnas[columna] = df_final[origen]
+        bloques.append(pd.DataFrame(columnas, index=df_final.index))
+    return bloques
+
+
+def _build_counterparts(df_procesado, descripcion_txn, cuentas_pais, reglas):
+    """Contrapartidas de Procesado a partir de sus líneas con importe."""
+    base = df_procesado[['Fecha registro', 'Nº documento', 'Cód. divisa', 'Importe debe', 'Importe haber']].assign(descripcion_txn=descripcion_txn)
+    resumen = base.groupby(CLAVES_CONTRAPARTIDA).agg(total_debe=('Importe debe', 'sum'), total_haber=('Importe haber', 'sum')).reset_index()
+    resumen = resumen[(resumen['total_debe'] != 0) | (resumen['total_haber'] != 0)]
+    if resumen.empty:
+        return pd.DataFrame([])
+    return pd.DataFrame({
+        'Tipo mov.': cuentas_pais['Tipo mov. Contrapartida'],
+        'Nº cuenta': cuentas_pais['Cuenta Contrapartida'],
+        'Fecha registro': resumen['Fecha registro'],
+        'Nº documento': resumen['Nº documento'],
+        'Descripción': resumen['descripcion_txn'].astype(str) + SUFIJO_CONTRAPARTIDA,
+        'Importe debe': resumen['total_haber'],
+        'Importe haber': resumen['total_debe'],
+        'Nº documento externo': reglas['doc_externo_contrapartida'],
+        'VAT\xa0Registration\xa0Type\xa0KCP': cuentas_pais['VAT\xa0Registration\xa0Type\xa0KCP'],
+        'VAT\xa0Registration\xa0No."': cuentas_pais['VAT\xa0Registration\xa0No."'],
+        'Cód. divisa': resumen['Cód. divisa'],
+    }, index=resumen.index)
+
+
+def _has_amount(df):
+    """Filas con algún importe distinto de cero."""
+    return (df['Importe debe'] != 0) | (df['Importe haber'] != 0)
+
+
+def _finish(df, columnas):
+    """Ordena las columnas de la plantilla y deja en blanco los vacíos y los importes en cero."""
+    df = df.reindex(columns=columnas).fillna('')
+    for columna in ['Importe debe', 'Importe haber']:
+        df[columna] = df[columna].replace(0, '')
+    return df
+
+
+def build_templates(df_totalizado, pais_actual, grupo_fecha, catalogs):
+    """Arma las plantillas Procesado y Revenue de una partición a partir de sus totales.
+
+    Devuelve (None, None) si el país no tiene cuentas en el catálogo Procesadora.
+    """
+    cuentas_pais = catalogs['procesadora_por_pais'].get(pais_actual.upper())
+    if cuentas_pais is None:
+        return None, None
+    reglas = country_rules(pais_actual)
+    df_final = pd.merge(df_totalizado, catalogs['txn'], on='transaction_type', how='left')
+    df_final['createddate'] = pd.to_datetime(df_final['createddate'])
+    derivadas = _derived_columns(df_final, reglas)
+
+    df_procesado, = _build_lines(LINEAS_PROCESADO, df_final, derivadas)
+    con_importe = _has_amount(df_procesado)
+    df_procesado = df_procesado[con_importe]
+    df_contrapartidas = _build_counterparts(df_procesado, df_final['descripcion_txn'][con_importe], cuentas_pais, reglas)
+    df_reporte_procesado = _finish(pd.concat([df_procesado, df_contrapartidas], ignore_index=True), COLUMNAS_PROCESADO)
+
+    df_revenue = pd.concat(_build_lines(LINEAS_REVENUE, df_final, derivadas), ignore_index=True)
+    df_reporte_revenue = _finish(df_revenue[_has_amount(df_revenue)], COLUMNAS_REVENUE)
+
+    fecha_contable_str = grupo_fecha.strftime("%Y%m%d")
+    nombre_archivo_procesado = f"Procesado_{pais_actual}_{fecha_contable_str}.xlsx"
+    nombre_archivo_revenue = f"Revenue_{pais_actual}_{fecha_contable_str}.xlsx"
+    return (nombre_archivo_procesado, df_reporte_procesado), (nombre_archivo_revenue, df_reporte_revenue)
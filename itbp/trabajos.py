@@ -0,0 +1,181 @@
+"""Cola de trabajos de generación en segundo plano, compartida por todas las sesiones."""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from itbp.escritura import create_zip_buffer, input_key
+from itbp.incremental import aggregate_uploads
+from itbp.instrumentacion import StageRecorder, profile_dump, profile_summary, profiled
+from itbp.memoria import PeakMemoryMonitor
+from itbp.motor import iter_templates
+from itbp.paralelo import MIN_BYTES_PARALELO, job_pool
+
+EN_COLA = 'en_cola'
+PROCESANDO = 'procesando'
+TERMINADO = 'terminado'
+SIN_ARCHIVOS = 'sin_archivos'
+ERROR = 'error'
+ESTADOS_ACTIVOS = (EN_COLA, PROCESANDO)
+
+
+class Job:
+    """Estado de un trabajo. Lo escribe solo el hilo que lo ejecuta; las sesiones lo leen para mostrar el avance."""
+
+    def __init__(self, clave, nombres_archivos, usuario=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.clave = clave
+        self.nombres_archivos = nombres_archivos
+        # Todos los que enviaron estos archivos; un envío repetido se resuelve con este mismo trabajo
+        self.usuarios = {usuario} if usuario else set()
+        self.estado = EN_COLA
+        self.mensaje = "En cola"
+        self.particiones_total = 0
+        self.particiones_hechas = 0
+        self.advertencias = []
+        self.resumen_lectura = []
+        self.n_archivos = 0
+        self.pico_bytes = 0
+        self.tiempos = None
+        self.perfil = None
+        self.error = None
+        self.creado = time.time()
+        self.iniciado = None
+        self.terminado = None
+
+    @property
+    def activo(self):
+        return self.estado in ESTADOS_ACTIVOS
+
+    @property
+    def progreso(self):
+        """Fracción de particiones terminadas (0 a 1)."""
+        if self.estado in (TERMINADO, SIN_ARCHIVOS):
+            return 1.0
+        return self.particiones_hechas / self.particiones_total if self.particiones_total else 0.0
+
+
+class JobQueue:
+    """Ejecuta la generación de reportes en un pool acotado de hilos, fuera del script de Streamlit.
+
+    Cada trabajo se identifica por un id; el ZIP terminado queda en
+    `archive_cache` bajo el input_key de sus archivos y catálogo, de modo que
+    se recupera por id desde cualquier sesión y sobrevive a los reruns. Un
+    envío con los mismos archivos y la misma versión del catálogo que un
+    trabajo en curso o terminado (con su ZIP aún disponible) devuelve ese
+    trabajo en lugar de ejecutar otro. Se conservan los últimos
+    `max_trabajos` trabajos finalizados.
+    """
+
+    def __init__(self, archive_cache, partial_cache=None, max_concurrentes=2, max_workers=1, max_trabajos=200):
+        self.archive_cache = archive_cache
+        self.partial_cache = partial_cache
+        self.max_workers = max_workers
+        self.max_trabajos = max_trabajos
+        self._trabajos = OrderedDict()
+        self._por_clave = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrentes, thread_name_prefix='itbp-trabajo')
+
+    def submit(self, archivos, catalogs, usuario=None, perfilar=False, mediciones_previas=(), perfil_previo=None):
+        """Encola la generación para una lista de (nombre, bytes); devuelve (Job, nuevo).
+
+        `nuevo` es False si el envío se resolvió con un trabajo existente; en
+        ese caso `usuario` se agrega a los usuarios del trabajo. Con `perfilar`
+        siempre se ejecuta un trabajo nuevo, bajo cProfile. Las mediciones y
+        el perfil de lo hecho antes de encolar (la carga de los catálogos)
+        pasan a formar parte de los del trabajo.
+        """
+        clave = input_key([contenido for _, contenido in archivos], catalogs.get('version'))
+        with self._lock:
+            if not perfilar:
+                existente = self._trabajos.get(self._por_clave.get(clave))
+                if existente and (existente.activo or self._has_result(existente)):
+                    if usuario:
+                        existente.usuarios.add(usuario)
+                    return existente, False
+            trabajo = Job(clave, [nombre for nombre, _ in archivos], usuario)
+            self._trabajos[trabajo.id] = trabajo
+            self._por_clave[clave] = trabajo.id
+            zip_generado = None if perfilar else self.archive_cache.get(clave)
+            if zip_generado:
+                # Generado antes de que existiera este trabajo (o ya descartado de la lista)
+                trabajo.estado, trabajo.mensaje = TERMINADO, "ZIP reutilizado de una ejecución anterior"
+                trabajo.n_archivos = zip_generado['n_archivos']
+                trabajo.terminado = time.time()
+            else:
+                self._pool.submit(self._run, trabajo, archivos, catalogs, perfilar, list(mediciones_previas), perfil_previo)
+            self._prune()
+        return trabajo, True
+
+    def get(self, trabajo_id):
+        with self._lock:
+            return self._trabajos.get(trabajo_id)
+
+    def result(self, trabajo_id):
+        """El ZIP de un trabajo terminado ({'datos', 'n_archivos'}), o None si no está disponible."""
+        trabajo = self.get(trabajo_id)
+        if trabajo is None or trabajo.estado != TERMINADO:
+            return None
+        return self.archive_cache.get(trabajo.clave)
+
+    def jobs(self, usuario=None):
+        """Trabajos conocidos, del más reciente al más antiguo; con `usuario`, solo los que envió."""
+        with self._lock:
+            return [trabajo for trabajo in reversed(self._trabajos.values()) if usuario is None or usuario in trabajo.usuarios]
+
+    def _has_result(self, trabajo):
+        return trabajo.estado == TERMINADO and self.archive_cache.get(trabajo.clave) is not None
+
+    def _prune(self):
+        finalizados = [trabajo for trabajo in self._trabajos.values() if not trabajo.activo]
+        for trabajo in finalizados[:max(0, len(finalizados) - self.max_trabajos)]:
+            del self._trabajos[trabajo.id]
+            if self._por_clave.get(trabajo.clave) == trabajo.id:
+                del self._por_clave[trabajo.clave]
+
+    def _run(self, trabajo, archivos, catalogs, perfilar, mediciones_previas, perfil_previo):
+        trabajo.estado, trabajo.mensaje, trabajo.iniciado = PROCESANDO, "Leyendo archivos de detalle...", time.time()
+        registro = StageRecorder(ejecucion=trabajo.id)
+        registro.extend(mediciones_previas)
+        # El perfil solo ve el hilo del trabajo, así que al perfilar no se usa el pool de procesos
+        pocos_datos = sum(len(contenido) for _, contenido in archivos) < MIN_BYTES_PARALELO
+        max_workers = 1 if perfilar or pocos_datos else self.max_workers
+        try:
+            # Un solo pool para todas las etapas del trabajo: los procesos se inician una vez
+            with PeakMemoryMonitor() as monitor_memoria, profiled(perfilar) as perfil, job_pool(max_workers, catalogs) as pool:
+                estado, mensaje = self._generate(trabajo, archivos, catalogs, registro, pool)
+            trabajo.pico_bytes = monitor_memoria.pico_bytes
+            if perfil:
+                perfiles = [perfil] + ([perfil_previo] if perfil_previo else [])
+                trabajo.perfil = {'datos': profile_dump(*perfiles), 'resumen': profile_summary(*perfiles)}
+        except Exception as e:
+            estado, mensaje, trabajo.error = ERROR, f"Error: {e}", str(e)
+        trabajo.tiempos = {'resumen': registro.summary(), 'detalle': registro.to_frame()}
+        trabajo.terminado = time.time()
+        # El estado final se publica al último, cuando el resto de los campos ya está completo
+        trabajo.estado, trabajo.mensaje = estado, mensaje
+
+    def _generate(self, trabajo, archivos, catalogs, registro, pool):
+        df_totalizado, particiones, trabajo.resumen_lectura = aggregate_uploads(archivos, catalogs, cache=self.partial_cache, pool=pool, registro=registro)
+        trabajo.particiones_total = len(particiones)
+        for resumen in trabajo.resumen_lectura:
+            if resumen['sin_particion']:
+                trabajo.advertencias.append(f"ADVERTENCIA: {resumen['sin_particion']} fila(s) de '{resumen['archivo']}' no tienen país o fecha de creación (createddate); no se incluyeron en ninguna plantilla.")
+        archivos_generados = []
+        for pais, grupo, resultado_procesado, resultado_revenue in iter_templates(df_totalizado, particiones, catalogs, pool=pool, registro=registro):
+            trabajo.particiones_hechas += 1
+            trabajo.mensaje = f"Procesando País: {pais} | Fecha Grupo: {grupo.strftime('%Y-%m-%d')}..."
+            if resultado_procesado and resultado_revenue:
+                archivos_generados.append(resultado_procesado)
+                archivos_generados.append(resultado_revenue)
+            else:
+                trabajo.advertencias.append(f"ADVERTENCIA: No se encontraron cuentas para '{pais}'. Omitiendo este grupo.")
+        if not archivos_generados:
+            return SIN_ARCHIVOS, "No se generaron archivos con los datos proporcionados."
+        trabajo.mensaje = "Empaquetando archivos..."
+        zip_generado = {'datos': create_zip_buffer(archivos_generados, pool=pool, registro=registro), 'n_archivos': len(archivos_generados)}
+        self.archive_cache.put(trabajo.clave, zip_generado)
+        trabajo.n_archivos = zip_generado['n_archivos']
+        return TERMINADO, "Proceso completado"